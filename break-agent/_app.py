@@ -1,6 +1,11 @@
 import gradio as gr
 import asyncio
+import os
 # from agents.models import Agent
+
+# The LLM provider is configured from the Django settings
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'break_agent.settings')
+
 from agents._agent.chat import initialize_history, get_response, get_secret_task
 from datetime import datetime, timedelta
 
@@ -53,7 +58,7 @@ class ChatInterface:
         self.history.append({"role": "user", "content": message})
         
         # Get response from the agent
-        response, secret_triggered = await get_response(self.history, self.secret_task_schema)
+        response, secret_triggered, _ = await get_response(self.history, self.secret_task_schema)
         
         # Add assistant response to OpenAI format history
         self.history.append({"role": "assistant", "content": response})
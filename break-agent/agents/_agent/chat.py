@@ -1,75 +1,220 @@
-from pydantic import BaseModel
-from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletionChunk, ChatCompletion
-from openai.types.chat import ChatCompletionMessageParam
-from typing import List, Dict, AsyncIterator, Any, Tuple
+from typing import List, Dict, AsyncIterator, Any, Optional, Tuple
+from functools import lru_cache
+import asyncio
+import json
+import logging
+import threading
+import time
 
-# from ..models import Agent
-from ._prompts import BASE_SYSTEM_PROMPT
+from django.conf import settings
 
-oai_client = AsyncOpenAI()
+from ..metrics import LLM_REQUESTS, LLM_SECONDS, LLM_TOKENS
+from ..prompts import build_secret_task_schema, render_system_prompt
+from .providers import get_provider
+from .scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+SECRET_TASK_COMPLETED = "Congratulations! You've completed the secret task!"
 
 
 
 def initialize_history(agent: Any) -> List[Dict]:
-    # TODO: Convert the agent details into a prompt
-    _sys_prompt = BASE_SYSTEM_PROMPT.format(
-        name=agent.name,
-        personality=agent.personality,
-        lore=agent.lore,
-        behavior=agent.behavior,
-        secret_task=agent.secret_task
-    )
-    
     return [
         {
             "role": "system",
-            "content": _sys_prompt
+            "content": render_system_prompt(agent)
         }
     ]
 
+# The tokenizer, once loaded. Loading can download the encoding file, so it is
+# never done on the event loop: load_encoding() runs at startup (in a thread,
+# from the ASGI lifespan) or in a background thread on first use.
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loading = False
+_encoding_failed_at = None
+# Seconds before a failed load (e.g. while offline) is retried
+ENCODING_RETRY_INTERVAL = 60
+
+def load_encoding():
+    """Load the tokenizer, blocking. Returns None if it can't be loaded."""
+    global _encoding, _encoding_loading, _encoding_failed_at
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning("Could not load the tokenizer, estimating token counts: %s", e)
+        with _encoding_lock:
+            _encoding_failed_at = time.monotonic()
+            _encoding_loading = False
+        return None
+    with _encoding_lock:
+        _encoding = encoding
+        _encoding_loading = False
+    return encoding
+
+def _get_encoding():
+    """The tokenizer if it is loaded; otherwise start loading it in the background and return None."""
+    global _encoding_loading
+    if _encoding is not None:
+        return _encoding
+    with _encoding_lock:
+        if _encoding_loading or (
+            _encoding_failed_at is not None and time.monotonic() - _encoding_failed_at < ENCODING_RETRY_INTERVAL
+        ):
+            return None
+        _encoding_loading = True
+    threading.Thread(target=load_encoding, name="load-tokenizer", daemon=True).start()
+    return None
+
+@lru_cache(maxsize=8192)
+def _count_encoded_tokens(text: str) -> int:
+    return len(_encoding.encode(text))
+
+def count_text_tokens(text: str) -> int:
+    if _get_encoding() is None:
+        # Until the tokenizer is loaded; estimates aren't cached so they're replaced by real counts
+        return (len(text) + 3) // 4
+    return _count_encoded_tokens(text)
+
+def count_tokens(messages: List[Dict]) -> int:
+    """Count the prompt tokens a list of chat messages costs, including per-message overhead."""
+    # Every message is wrapped in ~3 tokens of framing, and the reply is primed with 3 more
+    return sum(3 + count_text_tokens(m["role"]) + count_text_tokens(m["content"] or "") for m in messages) + 3
+
+def count_function_tokens(secret_task_schema: Dict[str, Any]) -> int:
+    """Approximate prompt tokens taken by the secret task function definition."""
+    return count_text_tokens(json.dumps(_secret_task_function(secret_task_schema)))
+
+def fit_history(history: List[Dict], max_tokens: int, reserved_tokens: int = 0,
+                block_size: int = 1) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Trim a history to fit a prompt token budget.
+
+    The system prompt and the latest message are always kept; older turns are
+    dropped from the front, block_size messages at a time, until the rest fits
+    in max_tokens - reserved_tokens. Dropping whole blocks means the start of
+    the window, and so the prompt prefix the provider can cache, only moves
+    every block_size messages instead of on every turn.
+
+    Returns:
+        tuple: (messages to send, token counts for the request)
+    """
+    system = [m for m in history if m["role"] == "system"]
+    turns = [m for m in history if m["role"] != "system"]
+
+    budget = max_tokens - reserved_tokens - count_tokens(system)
+    costs = [count_tokens([message]) - 3 for message in turns]
+    start = 0
+    while start < len(turns) - 1 and sum(costs[start:]) > budget:
+        start = min(start + block_size, len(turns) - 1)
+    kept = turns[start:]
+
+    # Don't start the window halfway through a turn
+    while len(kept) > 1 and kept[0]["role"] == "assistant":
+        kept.pop(0)
+
+    messages = system + kept
+    return messages, {
+        "history_tokens": count_tokens(history) + reserved_tokens,
+        "prompt_tokens": count_tokens(messages) + reserved_tokens,
+        "dropped_messages": len(turns) - len(kept),
+    }
+
 def get_secret_task(agent: Any) -> Dict[str, Any]:
-    class SecretTask(BaseModel):
-        __doc__ = f"Call this function if the secret task is completed: {agent.secret_task}"
-    
-    return SecretTask.model_json_schema()
-
-async def get_response(history: List[Dict], secret_task_schema: Dict[str, Any]) -> Tuple[str, bool]:    
-    response: ChatCompletion = await oai_client.chat.completions.create(
-        messages=history,
-        functions=[{
-            "name": "secret_task_completed",
-            "description": "Call this function when the user has completed the secret task",
-            "parameters": secret_task_schema
-        }],
-        model="gpt-4o",
-        max_tokens=1000,
-        temperature=0.7,
-    )
-    
-    message = response.choices[0].message
-    if message.function_call:
-        return "Congratulations! You've completed the secret task!", True
-    
-    return message.content or "", False
-
-# async def get_response_stream(query: str, history: List[Dict], secret_task_schema: Dict[str, Any]) -> AsyncIterator[str]:
-#     history.append(
-#         {
-#             "role": "user",
-#             "content": query
-#         }
-#     )
-
-#     response: AsyncIterator[ChatCompletionChunk] = await oai_client.chat.completions.create(
-#         messages=history,
-#         model="gpt-4o-mini",
-#         functions=[secret_task_schema],
-#         max_tokens=1000,
-#         temperature=0.0,
-#         stream=True
-#     )
-
-#     async for chunk in response:
-#         yield chunk.choices[0].delta.content
+    return build_secret_task_schema(agent)
+
+def _secret_task_function(secret_task_schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Sort the schema's keys so the definition is byte-identical however it
+    # was loaded; it is part of the prompt prefix the provider caches
+    return {
+        "name": "secret_task_completed",
+        "description": "Call this function when the user has completed the secret task",
+        "parameters": json.loads(json.dumps(secret_task_schema, sort_keys=True))
+    }
+
+def _request_tokens(history: List[Dict], functions: List[Dict]) -> int:
+    """The most tokens a request can use, which is what counts against the provider's rate limit."""
+    return count_tokens(history) + count_text_tokens(json.dumps(functions)) + settings.LLM_MAX_TOKENS
+
+def _record_metrics(started_at: float, outcome: str, usage: Optional[Dict[str, Optional[int]]]) -> None:
+    LLM_SECONDS.observe(time.perf_counter() - started_at, provider=settings.LLM_PROVIDER)
+    LLM_REQUESTS.inc(provider=settings.LLM_PROVIDER, outcome=outcome)
+    for kind, tokens in (usage or {}).items():
+        if tokens:
+            LLM_TOKENS.inc(tokens, kind=kind.replace("_tokens", ""))
+
+async def get_response(history: List[Dict], secret_task_schema: Dict[str, Any],
+                       cache_key: Optional[str] = None,
+                       user: Optional[str] = None) -> Tuple[str, bool, Dict[str, Optional[int]]]:
+    """
+    Get the agent's reply to a history from the configured LLM provider.
+    The request is queued with `user`'s others by the scheduler.
+
+    Returns:
+        tuple: (response, secret_task_completed, token usage)
+    """
+    functions = [_secret_task_function(secret_task_schema)]
+    started_at = time.perf_counter()
+    try:
+        completion = await get_scheduler().run(
+            lambda: get_provider().complete(history, functions, cache_key=cache_key),
+            user=user,
+            tokens=_request_tokens(history, functions),
+        )
+    except Exception as e:
+        _record_metrics(started_at, type(e).__name__, None)
+        raise
+    _record_metrics(started_at, "ok", completion.usage)
+    logger.debug("LLM completion", extra={'user_wallet': user, 'usage': completion.usage,
+                                          'seconds': time.perf_counter() - started_at})
+    if completion.function_call == "secret_task_completed":
+        return SECRET_TASK_COMPLETED, True, completion.usage
+
+    return completion.content, False, completion.usage
+
+async def get_response_stream(history: List[Dict], secret_task_schema: Dict[str, Any],
+                              cache_key: Optional[str] = None,
+                              user: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Stream a response as it is generated.
+
+    Yields ("token", str) for each piece of content as it arrives, then exactly
+    one ("done", (response, secret_task_completed, token usage)) once the
+    stream closes. If the model calls the secret task function mid-stream, the
+    final response is the same congratulations message get_response returns.
+    """
+    functions = [_secret_task_function(secret_task_schema)]
+    content = []
+    secret_task_completed = False
+    usage = None
+    started_at = time.perf_counter()
+    try:
+        async for kind, value in get_scheduler().stream(
+            lambda: get_provider().stream(history, functions, cache_key=cache_key),
+            user=user,
+            tokens=_request_tokens(history, functions),
+        ):
+            if kind == "function_call" and value == "secret_task_completed":
+                secret_task_completed = True
+            elif kind == "token":
+                content.append(value)
+                yield "token", value
+            elif kind == "usage":
+                usage = value
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away; not a provider failure
+        _record_metrics(started_at, "cancelled", usage)
+        raise
+    except Exception as e:
+        _record_metrics(started_at, type(e).__name__, usage)
+        raise
+    _record_metrics(started_at, "ok", usage)
+    logger.debug("LLM stream", extra={'user_wallet': user, 'usage': usage,
+                                      'seconds': time.perf_counter() - started_at})
 
+    if secret_task_completed:
+        yield "done", (SECRET_TASK_COMPLETED, True, usage)
+    else:
+        yield "done", ("".join(content), False, usage)
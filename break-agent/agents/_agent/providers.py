@@ -0,0 +1,309 @@
+"""
+LLM backends for agent chat.
+
+LLM_PROVIDER picks the backend:
+
+- 'openai': the OpenAI chat completions API, with LLM_MODEL, LLM_TIMEOUT and
+  LLM_MAX_RETRIES. The client is created lazily, one per event loop, so
+  importing this module needs no credentials.
+- 'mock': a deterministic local stand-in that replies after MOCK_LLM_LATENCY
+  seconds at MOCK_LLM_TOKENS_PER_SECOND, for load testing with no network.
+
+Providers send requests as they are asked to; concurrency, rate limits and
+retries are up to agents._agent.scheduler. They report a 429 as RateLimited
+and a transient failure as ProviderUnavailable, so the scheduler knows what
+it can retry.
+"""
+import asyncio
+import contextlib
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class LLMError(Exception):
+    pass
+
+
+class RateLimited(LLMError):
+    """The provider rejected the request with a 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderUnavailable(LLMError):
+    """The request failed in a way that may succeed if retried (timeout, connection error, 5xx)."""
+
+
+class Completion(NamedTuple):
+    content: str
+    # Name of the function the model called, if any
+    function_call: Optional[str]
+    # prompt_tokens, cached_tokens and completion_tokens (None if unknown)
+    usage: Dict[str, Optional[int]]
+
+
+def _usage(usage: Any) -> Dict[str, Optional[int]]:
+    """Token usage of an OpenAI completion, including how much of the prompt was served from cache."""
+    if usage is None:
+        return {"prompt_tokens": None, "cached_tokens": None, "completion_tokens": None}
+    details = usage.prompt_tokens_details
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": (details.cached_tokens or 0) if details else 0,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+def _retry_after(error: Any) -> Optional[float]:
+    """The Retry-After of a failed OpenAI request, in seconds."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMProvider:
+    async def complete(self, messages: List[Dict], functions: List[Dict],
+                       cache_key: Optional[str] = None) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict], functions: List[Dict],
+               cache_key: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a completion. Yields ("token", str) for each piece of content,
+        ("function_call", name) when the model calls a function, and finally
+        one ("usage", dict).
+        """
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    def __init__(self, model: str, max_tokens: int, temperature: float, timeout: float):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            # The scheduler does the retrying, so rate limits are handled in one place
+            client = self._clients[loop] = AsyncOpenAI(timeout=self.timeout, max_retries=0)
+        return client
+
+    @contextlib.contextmanager
+    def _errors(self):
+        import openai
+
+        try:
+            yield
+        except openai.RateLimitError as e:
+            raise RateLimited(str(e), _retry_after(e)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise ProviderUnavailable(str(e)) from e
+
+    def _options(self, cache_key: Optional[str]) -> Dict[str, Any]:
+        options = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        if cache_key:
+            # Requests sharing a prompt_cache_key are routed to the same prompt
+            # cache, so every user of an agent can hit its cached system prompt
+            options["extra_body"] = {"prompt_cache_key": cache_key}
+        return options
+
+    async def complete(self, messages, functions, cache_key=None):
+        with self._errors():
+            response = await self._client().chat.completions.create(
+                messages=messages,
+                functions=functions,
+                **self._options(cache_key),
+            )
+        message = response.choices[0].message
+        return Completion(
+            content=message.content or "",
+            function_call=message.function_call.name if message.function_call else None,
+            usage=_usage(response.usage),
+        )
+
+    async def stream(self, messages, functions, cache_key=None):
+        with self._errors():
+            stream = await self._client().chat.completions.create(
+                messages=messages,
+                functions=functions,
+                stream=True,
+                # The last chunk then carries the usage for the whole request
+                stream_options={"include_usage": True},
+                **self._options(cache_key),
+            )
+            usage = None
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.function_call and delta.function_call.name:
+                    yield "function_call", delta.function_call.name
+                if delta.content:
+                    yield "token", delta.content
+            yield "usage", _usage(usage)
+
+
+class MockProvider(LLMProvider):
+    """
+    Deterministic offline provider.
+
+    The reply is built from a hash of the conversation, so the same messages
+    always get the same reply. It takes `latency` seconds before the first
+    token and then `tokens_per_second`. A last user message containing
+    `secret_phrase` calls the first function, which lets load tests exercise
+    the payout path. Usage reports the system prompt as cached once a
+    cache_key has been seen, like a warm provider prompt cache. With
+    `requests_per_minute` set, requests beyond it are rejected with
+    RateLimited, like a provider's 429.
+    """
+    WORDS = (
+        'the', 'secret', 'is', 'safe', 'with', 'me', 'try', 'again', 'perhaps',
+        'another', 'way', 'you', 'will', 'not', 'trick', 'agent', 'prize', 'pool',
+    )
+
+    def __init__(self, latency: float, tokens_per_second: float, reply_tokens: int,
+                 secret_phrase: str, requests_per_minute: float = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.secret_phrase = secret_phrase.lower()
+        self._seen_cache_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.requests_per_minute = requests_per_minute
+        self._window_started_at = time.monotonic()
+        self._window_requests = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def _admit(self) -> None:
+        """Count a request against the per-minute limit, raising RateLimited past it."""
+        self.requests += 1
+        if not self.requests_per_minute:
+            return
+        now = time.monotonic()
+        if now - self._window_started_at >= 60:
+            self._window_started_at, self._window_requests = now, 0
+        if self._window_requests >= self.requests_per_minute:
+            self.rate_limited += 1
+            raise RateLimited("Mock provider rate limit exceeded", retry_after=60 - (now - self._window_started_at))
+        self._window_requests += 1
+
+    def _reply(self, messages: List[Dict]) -> List[str]:
+        digest = hashlib.sha256(repr([m["content"] for m in messages]).encode()).digest()
+        return [
+            ('' if i == 0 else ' ') + self.WORDS[digest[i % len(digest)] % len(self.WORDS)]
+            for i in range(self.reply_tokens)
+        ]
+
+    def _function_call(self, messages: List[Dict], functions: List[Dict]) -> Optional[str]:
+        last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if functions and self.secret_phrase and self.secret_phrase in last.lower():
+            return functions[0]["name"]
+        return None
+
+    def _usage(self, messages: List[Dict], cache_key: Optional[str], completion_tokens: int) -> Dict[str, int]:
+        from .chat import count_tokens
+
+        cached = 0
+        if cache_key in self._seen_cache_keys:
+            self._seen_cache_keys.move_to_end(cache_key)
+            cached = count_tokens([m for m in messages if m["role"] == "system"])
+        elif cache_key:
+            self._seen_cache_keys[cache_key] = None
+            if len(self._seen_cache_keys) > 10000:
+                self._seen_cache_keys.popitem(last=False)
+        return {
+            "prompt_tokens": count_tokens(messages),
+            "cached_tokens": cached,
+            "completion_tokens": completion_tokens,
+        }
+
+    async def complete(self, messages, functions, cache_key=None):
+        self._admit()
+        function_call = self._function_call(messages, functions)
+        tokens = [] if function_call else self._reply(messages)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return Completion(
+            content="".join(tokens),
+            function_call=function_call,
+            usage=self._usage(messages, cache_key, len(tokens)),
+        )
+
+    async def stream(self, messages, functions, cache_key=None):
+        self._admit()
+        function_call = self._function_call(messages, functions)
+        tokens = [] if function_call else self._reply(messages)
+        await asyncio.sleep(self.latency)
+        if function_call:
+            yield "function_call", function_call
+        for token in tokens:
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield "token", token
+        yield "usage", self._usage(messages, cache_key, len(tokens))
+
+
+def _openai_provider() -> OpenAIProvider:
+    return OpenAIProvider(
+        model=settings.LLM_MODEL,
+        max_tokens=settings.LLM_MAX_TOKENS,
+        temperature=settings.LLM_TEMPERATURE,
+        timeout=settings.LLM_TIMEOUT,
+    )
+
+
+def _mock_provider() -> MockProvider:
+    return MockProvider(
+        latency=settings.MOCK_LLM_LATENCY,
+        tokens_per_second=settings.MOCK_LLM_TOKENS_PER_SECOND,
+        reply_tokens=settings.MOCK_LLM_REPLY_TOKENS,
+        secret_phrase=settings.MOCK_LLM_SECRET_PHRASE,
+        requests_per_minute=settings.MOCK_LLM_REQUESTS_PER_MINUTE,
+    )
+
+
+LLM_PROVIDERS = {
+    'openai': _openai_provider,
+    'mock': _mock_provider,
+}
+
+PROVIDER_SETTINGS = (
+    'LLM_PROVIDER', 'LLM_MODEL', 'LLM_MAX_TOKENS', 'LLM_TEMPERATURE', 'LLM_TIMEOUT',
+    'MOCK_LLM_LATENCY', 'MOCK_LLM_TOKENS_PER_SECOND', 'MOCK_LLM_REPLY_TOKENS', 'MOCK_LLM_SECRET_PHRASE',
+    'MOCK_LLM_REQUESTS_PER_MINUTE',
+)
+
+_provider = None
+_provider_config = None
+
+
+def get_provider() -> LLMProvider:
+    """Return the configured provider, rebuilding it if its settings changed."""
+    global _provider, _provider_config
+    config = tuple(getattr(settings, name) for name in PROVIDER_SETTINGS)
+    if _provider is None or config != _provider_config:
+        if settings.LLM_PROVIDER not in LLM_PROVIDERS:
+            raise ImproperlyConfigured(f"Unknown LLM_PROVIDER: {settings.LLM_PROVIDER}")
+        _provider = LLM_PROVIDERS[settings.LLM_PROVIDER]()
+        _provider_config = config
+    return _provider
@@ -0,0 +1,287 @@
+"""
+Scheduling of LLM requests.
+
+Every chat completion goes through the per-worker scheduler, which:
+
+- runs at most LLM_MAX_CONCURRENCY requests at once. Others wait in a queue
+  per user and are admitted round-robin across users, so one user's burst
+  can't starve everyone else.
+- spaces requests to stay under LLM_REQUESTS_PER_MINUTE and
+  LLM_TOKENS_PER_MINUTE, the provider's rate limits, with token buckets.
+- retries rate-limited (429) and transient provider errors up to
+  LLM_MAX_RETRIES times with exponential backoff. A 429 pauses the buckets
+  for every request, not just the one that got it.
+- sheds load once LLM_QUEUE_SIZE requests are waiting, raising
+  LLMOverloaded straight away instead of queueing work that would time out.
+"""
+import asyncio
+import contextlib
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from django.conf import settings
+
+from .providers import LLMError, ProviderUnavailable, RateLimited
+
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloaded(LLMError):
+    """The scheduler's queue is full; the request was rejected without being sent."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many requests are waiting for the agent, please try again shortly")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` a minute, holding at most a
+    minute's worth. A rate of 0 disables it.
+
+    Shared by all event loops in the process, so it is guarded by a lock
+    rather than asyncio primitives.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+
+    def reserve(self, cost: float) -> float:
+        """
+        Take `cost` tokens, going into debt if there aren't enough. Returns how
+        many seconds the caller must wait before the tokens are really there.
+        """
+        if not self.per_minute:
+            return max(self.paused_until - time.monotonic(), 0.0)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A request bigger than the bucket could never fit; let it through when full
+            cost = min(cost, self.capacity)
+            self.tokens -= cost
+            wait = -self.tokens * 60 / self.per_minute if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request back for `seconds`, e.g. after the provider returns a 429."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            if self.per_minute:
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, 0.0)
+
+
+class _LoopState:
+    """The slots and queues of one event loop."""
+
+    def __init__(self):
+        self.running = 0
+        # user -> waiters, in the order users get their next turn
+        self.queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, requests_per_minute: float,
+                 tokens_per_minute: float, max_retries: int, backoff: float, max_backoff: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self.completed = 0
+        self.shed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    def _dispatch(self, state: _LoopState) -> None:
+        """Hand free slots to the next waiting user in turn."""
+        while state.running < self.max_concurrency and state.queues:
+            user, waiters = state.queues.popitem(last=False)
+            waiter = waiters.popleft()
+            state.queued -= 1
+            if waiters:
+                # The user goes to the back of the line for their next request
+                state.queues[user] = waiters
+            if waiter.done():
+                continue
+            state.running += 1
+            waiter.set_result(None)
+
+    def _dequeue(self, state: _LoopState, user: str, waiter: asyncio.Future) -> None:
+        waiters = state.queues.get(user)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        state.queued -= 1
+        if not waiters:
+            del state.queues[user]
+
+    def check_capacity(self) -> None:
+        """
+        Raise LLMOverloaded if a new request would be shed, so callers can turn
+        it away before doing any work for it.
+        """
+        state = self._state()
+        if state.running >= self.max_concurrency and state.queued >= self.max_queue:
+            self.shed += 1
+            raise LLMOverloaded(retry_after=self.backoff)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user: Optional[str] = None, tokens: int = 0):
+        """
+        Hold a concurrency slot for one provider request from `user`, after
+        waiting for the rate limits to allow `tokens` more tokens.
+
+        Raises LLMOverloaded if the queue is full.
+        """
+        state = self._state()
+        if state.running < self.max_concurrency and not state.queues:
+            state.running += 1
+        else:
+            if state.queued >= self.max_queue:
+                self.shed += 1
+                raise LLMOverloaded(retry_after=self.backoff)
+            waiter = asyncio.get_running_loop().create_future()
+            key = user or ''
+            state.queues.setdefault(key, deque()).append(waiter)
+            state.queued += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Given a slot just as we were cancelled; pass it on
+                    state.running -= 1
+                    self._dispatch(state)
+                else:
+                    # Still queued (e.g. the client disconnected); stop counting it
+                    self._dequeue(state, key, waiter)
+                raise
+        try:
+            await asyncio.sleep(max(self.requests.reserve(1), self.tokens.reserve(tokens)))
+            yield
+        finally:
+            state.running -= 1
+            self._dispatch(state)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        # Jitter, so requests that were rate limited together don't retry together
+        delay *= random.uniform(0.5, 1.0)
+        return max(delay, retry_after or 0.0)
+
+    async def run(self, call: Callable[[], Awaitable[T]], user: Optional[str] = None, tokens: int = 0) -> T:
+        """
+        Run `call` (one provider request) in a slot, retrying it with backoff
+        if it is rate limited or the provider is briefly unavailable.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(user, tokens):
+                    result = await call()
+                self.completed += 1
+                return result
+            except (RateLimited, ProviderUnavailable) as e:
+                await self._retry_wait(e, attempt)
+                attempt += 1
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]], user: Optional[str] = None,
+                     tokens: int = 0) -> AsyncIterator[T]:
+        """
+        Like run, for a streaming request. It is only retried if it fails
+        before yielding anything; after that the error is passed on.
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.slot(user, tokens):
+                    async for item in open_stream():
+                        started = True
+                        yield item
+                self.completed += 1
+                return
+            except (RateLimited, ProviderUnavailable) as e:
+                if started:
+                    raise
+                await self._retry_wait(e, attempt)
+                attempt += 1
+
+    async def _retry_wait(self, error: LLMError, attempt: int) -> None:
+        """Record a failed attempt and wait before the next one, or re-raise if out of retries."""
+        retry_after = getattr(error, 'retry_after', None)
+        if isinstance(error, RateLimited):
+            self.rate_limited += 1
+            self.requests.pause(retry_after or self._backoff(attempt, None))
+        if attempt >= self.max_retries:
+            logger.warning("LLM request failed after %d attempts: %s", attempt + 1, error)
+            raise error
+        self.retries += 1
+        delay = self._backoff(attempt, retry_after)
+        logger.info("LLM request failed (%s), retrying in %.1fs", error, delay)
+        await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        states = list(self._states.values())
+        return {
+            'running': sum(state.running for state in states),
+            'queued': sum(state.queued for state in states),
+            'completed': self.completed,
+            'shed': self.shed,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+        }
+
+
+SCHEDULER_SETTINGS = (
+    'LLM_MAX_CONCURRENCY', 'LLM_QUEUE_SIZE', 'LLM_REQUESTS_PER_MINUTE', 'LLM_TOKENS_PER_MINUTE',
+    'LLM_MAX_RETRIES', 'LLM_RETRY_BACKOFF', 'LLM_RETRY_MAX_BACKOFF',
+)
+
+_scheduler = None
+_scheduler_config = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the worker's scheduler, rebuilding it if its settings changed."""
+    global _scheduler, _scheduler_config
+    config = tuple(getattr(settings, name) for name in SCHEDULER_SETTINGS)
+    if _scheduler is None or config != _scheduler_config:
+        _scheduler = LLMScheduler(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue=settings.LLM_QUEUE_SIZE,
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff=settings.LLM_RETRY_BACKOFF,
+            max_backoff=settings.LLM_RETRY_MAX_BACKOFF,
+        )
+        _scheduler_config = config
+    return _scheduler
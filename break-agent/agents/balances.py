@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import rpc
+from .solana import LAMPORTS_PER_SOL
+
+logger = logging.getLogger(__name__)
+
+# getMultipleAccounts accepts at most 100 pubkeys per request
+MAX_ACCOUNTS_PER_REQUEST = 100
+
+
+async def get_solana_balance(wallet_address: str) -> float:
+    """Get balance for a Solana wallet using direct RPC call."""
+    try:
+        result = await rpc.call("getBalance", [wallet_address])
+        return float(result['value']) / LAMPORTS_PER_SOL
+    except Exception as e:
+        logger.warning("Error getting balance for wallet %s: %s", wallet_address, e)
+        return 0
+
+
+async def _get_account_lamports(addresses: List[str]) -> Dict[str, int]:
+    """Resolve one chunk of addresses with a single getMultipleAccounts call."""
+    # Only lamports are needed, so skip the account data entirely
+    result = await rpc.call(
+        "getMultipleAccounts",
+        [addresses, {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}]
+    )
+
+    # Accounts that don't exist on chain come back as null
+    return {
+        address: (account or {}).get('lamports', 0)
+        for address, account in zip(addresses, result['value'])
+    }
+
+
+async def _fetch_balances(addresses: List[str]) -> Dict[str, float]:
+    """
+    Fetch balances in chunks of MAX_ACCOUNTS_PER_REQUEST, one getMultipleAccounts
+    call per chunk, with the chunks fetched concurrently.
+
+    Returns only the addresses that were resolved; failed chunks are left out.
+    """
+    chunks = [
+        addresses[i:i + MAX_ACCOUNTS_PER_REQUEST]
+        for i in range(0, len(addresses), MAX_ACCOUNTS_PER_REQUEST)
+    ]
+
+    results = await asyncio.gather(
+        *(_get_account_lamports(chunk) for chunk in chunks),
+        return_exceptions=True
+    )
+
+    balances = {}
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            logger.warning("Error getting balances for %d wallets: %s", len(chunk), result)
+            continue
+        for address, lamports in result.items():
+            balances[address] = float(lamports) / LAMPORTS_PER_SOL
+
+    return balances
+
+
+async def get_solana_balances(wallet_addresses: Iterable[str]) -> Dict[str, float]:
+    """
+    Get balances for many Solana wallets at once.
+
+    Addresses are split into chunks of MAX_ACCOUNTS_PER_REQUEST and each chunk is
+    resolved with one getMultipleAccounts call; the chunks are fetched concurrently.
+
+    Args:
+        wallet_addresses: Wallet addresses to look up (duplicates are fetched once)
+
+    Returns:
+        dict: Mapping of wallet address to balance in SOL. Addresses whose chunk
+              failed are reported with a balance of 0, like get_solana_balance.
+    """
+    addresses = list(dict.fromkeys(wallet_addresses))
+    balances = {address: 0 for address in addresses}
+    if addresses:
+        balances.update(await _fetch_balances(addresses))
+    return balances
+
+
+class LocalBalanceCache:
+    """In-process balance cache. Each worker keeps its own copy."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def get_many(self, addresses: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        found = {}
+        for address in addresses:
+            entry = self._entries.get(address)
+            if entry is None:
+                continue
+            expires_at, balance = entry
+            if expires_at <= now:
+                del self._entries[address]
+                continue
+            found[address] = balance
+        return found
+
+    async def set_many(self, balances: Dict[str, float], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        for address, balance in balances.items():
+            self._entries.pop(address, None)
+            self._entries[address] = (expires_at, balance)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete_many(self, addresses: List[str]) -> None:
+        for address in addresses:
+            self._entries.pop(address, None)
+
+    async def adelete_many(self, addresses: List[str]) -> None:
+        self.delete_many(addresses)
+
+
+class DjangoBalanceCache:
+    """Balance cache backed by a Django cache alias, shared by every worker using it."""
+
+    key_prefix = 'balance:'
+
+    def __init__(self, alias: str = None):
+        self.alias = alias or settings.BALANCE_CACHE_ALIAS
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    async def get_many(self, addresses: List[str]) -> Dict[str, float]:
+        found = await self.cache.aget_many([self.key_prefix + address for address in addresses])
+        return {key[len(self.key_prefix):]: balance for key, balance in found.items()}
+
+    async def set_many(self, balances: Dict[str, float], ttl: float) -> None:
+        await self.cache.aset_many(
+            {self.key_prefix + address: balance for address, balance in balances.items()},
+            timeout=ttl
+        )
+
+    def delete_many(self, addresses: List[str]) -> None:
+        self.cache.delete_many([self.key_prefix + address for address in addresses])
+
+    async def adelete_many(self, addresses: List[str]) -> None:
+        await self.cache.adelete_many([self.key_prefix + address for address in addresses])
+
+
+BALANCE_CACHE_BACKENDS = {
+    'local': LocalBalanceCache,
+    'django': DjangoBalanceCache,
+}
+
+_balance_cache = None
+
+# Per event loop: address -> task of a balance fetch already in flight
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]" = weakref.WeakKeyDictionary()
+
+
+def balance_cache_is_shared() -> bool:
+    """Whether other processes see this one's balance invalidations."""
+    if settings.BALANCE_CACHE_BACKEND != 'django':
+        return False
+    return not isinstance(caches[settings.BALANCE_CACHE_ALIAS], LocMemCache)
+
+
+def get_balance_cache():
+    global _balance_cache
+    if _balance_cache is None:
+        backend = settings.BALANCE_CACHE_BACKEND
+        if backend not in BALANCE_CACHE_BACKENDS:
+            raise ImproperlyConfigured(f"Unknown BALANCE_CACHE_BACKEND: {backend}")
+        _balance_cache = BALANCE_CACHE_BACKENDS[backend]()
+    return _balance_cache
+
+
+async def _fetch_and_cache(addresses: List[str]) -> Dict[str, float]:
+    balances = await _fetch_balances(addresses)
+    if balances:
+        await get_balance_cache().set_many(balances, settings.BALANCE_CACHE_TTL)
+    return balances
+
+
+async def get_cached_balances(wallet_addresses: Iterable[str]) -> Dict[str, float]:
+    """
+    Like get_solana_balances, but served from the balance cache when possible.
+
+    Misses are fetched in one batch and stored for BALANCE_CACHE_TTL seconds.
+    Concurrent misses for the same address share a single RPC fetch instead of
+    each issuing their own. Failed lookups are reported as 0 and not cached.
+    """
+    addresses = list(dict.fromkeys(wallet_addresses))
+    if not addresses:
+        return {}
+
+    balances = await get_balance_cache().get_many(addresses)
+    misses = [address for address in addresses if address not in balances]
+    if not misses:
+        return balances
+
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    tasks = {address: inflight[address] for address in misses if address in inflight}
+    to_fetch = [address for address in misses if address not in tasks]
+
+    if to_fetch:
+        task = asyncio.ensure_future(_fetch_and_cache(to_fetch))
+        for address in to_fetch:
+            inflight[address] = tasks[address] = task
+
+        def _done(task, addresses=to_fetch):
+            for address in addresses:
+                if inflight.get(address) is task:
+                    del inflight[address]
+        task.add_done_callback(_done)
+
+    # Shielded so one cancelled caller doesn't cancel a fetch others are waiting on
+    results = {}
+    for task in set(tasks.values()):
+        results[task] = await asyncio.shield(task)
+    for address, task in tasks.items():
+        balances[address] = results[task].get(address, 0)
+
+    return balances
+
+
+async def get_cached_balance(wallet_address: str) -> float:
+    """Get a single wallet balance through the balance cache."""
+    return (await get_cached_balances([wallet_address]))[wallet_address]
+
+
+def invalidate_balances(wallet_addresses: Iterable[str]) -> None:
+    """Drop cached balances, e.g. after funds have moved in or out of these wallets."""
+    get_balance_cache().delete_many(list(wallet_addresses))
+
+
+async def ainvalidate_balances(wallet_addresses: Iterable[str]) -> None:
+    """Async version of invalidate_balances for use on the event loop."""
+    await get_balance_cache().adelete_many(list(wallet_addresses))
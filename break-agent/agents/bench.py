@@ -0,0 +1,179 @@
+"""
+Helpers for the benchmark management commands.
+
+Requests are sent straight to the ASGI application rather than through
+django.test's client, so they go through the same request_started /
+request_finished connection handling as they would under a real server.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.db.backends.signals import connection_created
+
+from .models import PooledWallet
+
+# Queries made by the current request, while count_queries() is active
+_query_counter: contextvars.ContextVar = contextvars.ContextVar('bench_query_counter', default=None)
+
+
+async def asgi_request(app, method: str, path: str, params: Optional[Dict] = None,
+                       body: Optional[Dict] = None, form: Optional[Dict] = None,
+                       headers: Optional[Dict] = None) -> Tuple[int, Dict, bytes]:
+    """
+    Send one HTTP request to an ASGI app and return (status, headers, body).
+    `body` is sent as JSON and `form` as an urlencoded form.
+    """
+    raw_headers = [(b'host', b'testserver')]
+    if form is not None:
+        payload = urlencode(form).encode()
+        raw_headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+    elif body is not None:
+        payload = json.dumps(body).encode()
+        raw_headers.append((b'content-type', b'application/json'))
+    else:
+        payload = b''
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(params or {}).encode(),
+        'headers': raw_headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+
+    request_sent = False
+    response_done = asyncio.Event()
+    status = None
+    response_headers = {}
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        # The client stays connected until the response is complete
+        await response_done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            response_headers.update((name.decode().lower(), value.decode()) for name, value in message.get('headers', []))
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status, response_headers, b''.join(chunks)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict:
+    """Latency percentiles (ms) and throughput for a run of requests."""
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def run_load(make_request, total: int, concurrency: int) -> Tuple[List[float], float]:
+    """
+    Call make_request() `total` times with at most `concurrency` in flight.
+    Returns the per-request latencies and the wall-clock time of the run.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await make_request()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Count the queries of every request made inside the block, whichever
+    connection or thread they run on. Use query_counter() to start counting
+    the current request's queries.
+    """
+    connection_created.connect(_install_query_counter)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(_install_query_counter)
+
+
+def query_counter() -> List[int]:
+    """
+    Start counting queries made from here on in this context (and the
+    threads and tasks it starts). Returns a one-item list holding the count.
+    """
+    counter = [0]
+    _query_counter.set(counter)
+    return counter
+
+
+def pooled_wallets() -> Dict[str, str]:
+    """The wallets now in the pool, as {wallet_address: encrypted_private_key}."""
+    return dict(PooledWallet.objects.values_list('wallet_address', 'encrypted_private_key'))
+
+
+def return_claimed_wallets(pooled: Dict[str, str], wallet_addresses: Iterable[str]) -> int:
+    """
+    Put the wallets of benchmark agents that were claimed from the pool back
+    into it, given a pooled_wallets() snapshot taken before they were claimed.
+    Nothing else in the pool is touched. Returns the number put back.
+    """
+    wallets = [
+        PooledWallet(wallet_address=address, encrypted_private_key=pooled[address])
+        for address in wallet_addresses if address in pooled
+    ]
+    PooledWallet.objects.bulk_create(wallets, ignore_conflicts=True)
+    return len(wallets)
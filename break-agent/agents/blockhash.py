@@ -0,0 +1,100 @@
+"""
+Shared cache of the most recent blockhash.
+
+A blockhash stays usable for ~150 blocks (about a minute), so transfers reuse
+the cached one instead of calling getLatestBlockhash each time. It is
+refetched once it is older than BLOCKHASH_MAX_AGE, when a send is rejected
+because the node no longer knows it, or in the background by run_refresher.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from . import rpc
+
+logger = logging.getLogger(__name__)
+
+
+class BlockhashCache:
+    def __init__(self):
+        # (blockhash, last valid block height, monotonic time fetched)
+        self._value: Optional[Tuple[str, int, float]] = None
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.stale_rejections = 0
+
+    def peek(self) -> Optional[Tuple[str, int]]:
+        """Return the cached blockhash if it is still fresh, without fetching."""
+        if self._value is None:
+            return None
+        blockhash, last_valid_block_height, fetched_at = self._value
+        if time.monotonic() - fetched_at > settings.BLOCKHASH_MAX_AGE:
+            return None
+        return blockhash, last_valid_block_height
+
+    def store(self, blockhash: str, last_valid_block_height: int) -> None:
+        self._value = (blockhash, last_valid_block_height, time.monotonic())
+
+    def invalidate(self, stale: bool = False) -> None:
+        """Drop the cached blockhash, e.g. after a send was rejected because of it."""
+        self._value = None
+        if stale:
+            self.stale_rejections += 1
+
+    async def refresh(self) -> Tuple[str, int]:
+        """Fetch the latest blockhash. Concurrent callers share one request."""
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(loop)
+        if task is None:
+            task = self._inflight[loop] = asyncio.ensure_future(self._fetch())
+            task.add_done_callback(lambda _: self._inflight.pop(loop, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self) -> Tuple[str, int]:
+        latest = await rpc.call("getLatestBlockhash")
+        self.refreshes += 1
+        self.store(latest['value']['blockhash'], latest['value']['lastValidBlockHeight'])
+        return latest['value']['blockhash'], latest['value']['lastValidBlockHeight']
+
+    async def get(self) -> Tuple[str, int]:
+        """Return (blockhash, last valid block height), fetching only if the cached one is stale."""
+        cached = self.peek()
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        return await self.refresh()
+
+    async def run_refresher(self, interval: float = None) -> None:
+        """Keep the cache warm so transfers never wait on getLatestBlockhash."""
+        interval = interval or settings.BLOCKHASH_REFRESH_INTERVAL
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Error refreshing blockhash: %s", e)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'refreshes': self.refreshes,
+            'stale_rejections': self.stale_rejections,
+        }
+
+
+blockhash_cache = BlockhashCache()
+
+
+def is_blockhash_not_found(error: Exception) -> bool:
+    """Whether a send was rejected because the node doesn't know its blockhash."""
+    return isinstance(error, rpc.RPCError) and 'blockhash not found' in error.message.lower()
@@ -0,0 +1,367 @@
+"""
+In-memory snapshot of the active agent catalogue.
+
+The catalogue only changes when an agent is created, edited or expires, so
+each worker keeps every active agent in memory and list_agents pages over
+that instead of querying the database and the chain per request. The
+snapshot is rebuilt when:
+
+- an agent is saved or deleted: a signal invalidates this worker's snapshot
+  and bumps a generation counter in the Django cache, which other workers
+  check every CATALOGUE_REFRESH_INTERVAL seconds;
+- the agent table's highest id or row count changed, also checked every
+  CATALOGUE_REFRESH_INTERVAL seconds. This catches agents created or deleted
+  by other workers when the cache isn't shared (no REDIS_URL), or without
+  signals (bulk_create);
+- the earliest expires_at in the snapshot has passed.
+
+Prize pools live on chain and are refreshed by run_refresher in the
+background (started from the ASGI lifespan). Without it, e.g. under
+runserver, a stale set of prize pools is refreshed inline on read.
+
+Every version of the snapshot has an ETag derived from its contents, so any
+worker serving the same catalogue answers If-None-Match with 304.
+
+Pages are keyset-paginated: the cursor carries the (sort value, id) of the
+last agent returned and the next page continues strictly after it, so agents
+created meanwhile don't shift later pages. The personality, lore, behavior
+and secret_task JSON blobs are only returned when requested with `fields`.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .balances import get_cached_balances
+from .models import Agent
+
+logger = logging.getLogger(__name__)
+
+DETAIL_FIELDS = ('personality', 'lore', 'behavior', 'secret_task')
+SORT_FIELDS = ('created_at', 'expires_at', 'prize_pool')
+
+GENERATION_CACHE_KEY = 'agents:catalogue:generation'
+
+
+def encode_cursor(sort: str, value, agent_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, agent_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[object, int]:
+    """Return the (sort value, id) a cursor points at. Raises ValueError if it is invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, agent_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor was issued for a different sort order')
+    if sort != 'prize_pool':
+        value = datetime.fromisoformat(value)
+    return value, int(agent_id)
+
+
+def parse_sort(sort: Optional[str]) -> Tuple[str, bool]:
+    """Parse 'field' or '-field' into (field, descending)."""
+    sort = sort or 'created_at'
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f'sort must be one of: {", ".join(SORT_FIELDS)} (prefix with - for descending)')
+    return field, descending
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return []
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in DETAIL_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(DETAIL_FIELDS)}')
+    return requested
+
+
+def parse_limit(limit: Optional[str]) -> int:
+    if not limit:
+        return settings.AGENT_LIST_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, settings.AGENT_LIST_MAX_PAGE_SIZE))
+
+
+def _parse_datetime(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_float(value: Optional[str], name: str) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def _after_cursor(key: Tuple, cursor: Tuple, descending: bool) -> bool:
+    return key < cursor if descending else key > cursor
+
+
+def _serialize(agent: Agent) -> Dict:
+    data = {
+        'id': agent.id,
+        'name': agent.name,
+        'wallet_address': agent.wallet_address,
+        'created_at': agent.created_at.isoformat(),
+        'expires_at': agent.expires_at.isoformat(),
+        'creator': {
+            'wallet_address': agent.creator.wallet_address
+        },
+    }
+    for field in DETAIL_FIELDS:
+        data[field] = getattr(agent, field)
+    return data
+
+
+def bump_generation() -> None:
+    """Tell every worker's catalogue that the agents changed."""
+    catalogue.invalidate()
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(GENERATION_CACHE_KEY, 1, None)
+
+
+class Catalogue:
+    def __init__(self):
+        # (agent, serialized agent without prize_pool), ordered by (created_at, id)
+        self._agents: Optional[List[Tuple[Agent, Dict]]] = None
+        self._dirty = False
+        self._prize_pools: Dict[str, float] = {}
+        self._prize_pools_at = 0.0
+        self._generation = None
+        self._fingerprint = None
+        self._generation_checked_at = 0.0
+        self._next_expiry: Optional[datetime] = None
+        self._pages: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = weakref.WeakKeyDictionary()
+        self._refresher_running = False
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[float] = None
+        self.rebuilds = 0
+        self.prize_pool_refreshes = 0
+        self.page_hits = 0
+        self.page_misses = 0
+
+    def invalidate(self) -> None:
+        """Mark this worker's snapshot as outdated so the next read rebuilds it."""
+        self._dirty = True
+
+    def _is_stale(self) -> bool:
+        return (
+            self._agents is None
+            or self._dirty
+            or (self._next_expiry is not None and timezone.now() >= self._next_expiry)
+        )
+
+    async def _fingerprint_agents(self) -> Tuple[Optional[int], int]:
+        """(highest id, count) of the agent table, which changes when agents are created or deleted."""
+        result = await Agent.objects.aaggregate(max_id=Max('id'), count=Count('id'))
+        return result['max_id'], result['count']
+
+    async def _check_generation(self) -> None:
+        """Invalidate the snapshot if another worker changed the agents."""
+        self._generation_checked_at = time.monotonic()
+        generation = await cache.aget(GENERATION_CACHE_KEY, 0)
+        if generation != self._generation or await self._fingerprint_agents() != self._fingerprint:
+            self.invalidate()
+
+    async def ensure(self) -> None:
+        """Make sure the snapshot is current before serving from it."""
+        if not self._refresher_running:
+            if time.monotonic() - self._generation_checked_at > settings.CATALOGUE_REFRESH_INTERVAL:
+                await self._check_generation()
+        if self._is_stale():
+            await self.rebuild()
+        elif not self._refresher_running and time.monotonic() - self._prize_pools_at > settings.CATALOGUE_REFRESH_INTERVAL:
+            await self.refresh_prize_pools()
+
+    async def rebuild(self) -> None:
+        """Reload the active agents. Concurrent callers share one rebuild."""
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(loop)
+        if task is None:
+            task = self._inflight[loop] = asyncio.ensure_future(self._build())
+            task.add_done_callback(lambda _: self._inflight.pop(loop, None))
+        await asyncio.shield(task)
+
+    async def _build(self) -> None:
+        # Reset the flag and read the generation first, so a change made
+        # during the query triggers another rebuild rather than being missed
+        self._dirty = False
+        generation = await cache.aget(GENERATION_CACHE_KEY, 0)
+        fingerprint = await self._fingerprint_agents()
+        agents = [
+            agent async for agent in Agent.objects.select_related('creator')
+            .defer('private_key', 'system_prompt', 'secret_task_schema')
+            .filter(expires_at__gt=timezone.now())
+            .order_by('created_at', 'id')
+        ]
+        prize_pools = await get_cached_balances(agent.wallet_address for agent in agents)
+
+        self._agents = [(agent, _serialize(agent)) for agent in agents]
+        self._next_expiry = min((agent.expires_at for agent in agents), default=None)
+        self._generation = generation
+        self._fingerprint = fingerprint
+        self._generation_checked_at = time.monotonic()
+        self._prize_pools = prize_pools
+        self._prize_pools_at = time.monotonic()
+        self.rebuilds += 1
+        self._changed()
+
+    async def refresh_prize_pools(self) -> None:
+        """Refetch every agent's prize pool, bumping the version only if one changed."""
+        if self._agents is None:
+            return
+        prize_pools = await get_cached_balances(agent.wallet_address for agent, _ in self._agents)
+        self._prize_pools_at = time.monotonic()
+        self.prize_pool_refreshes += 1
+        if prize_pools != self._prize_pools:
+            self._prize_pools = prize_pools
+            self._changed()
+
+    def _changed(self) -> None:
+        """Compute the new version's ETag and forget pages rendered from the old one."""
+        digest = hashlib.sha1(json.dumps(
+            [[data for _, data in self._agents], self._prize_pools], sort_keys=True, default=str
+        ).encode()).hexdigest()
+        if f'"{digest}"' != self.etag:
+            self.etag = f'"{digest}"'
+            self.last_modified = time.time()
+            self._pages.clear()
+
+    def page(self, params) -> Dict:
+        """
+        Return one page of active agents as {'agents': [...], 'next_cursor': str or None}.
+
+        `params` is a mapping of the request's query parameters: limit, cursor,
+        fields, sort, expires_after, expires_before, min_prize_pool and
+        max_prize_pool. Raises ValueError if any of them are invalid.
+        """
+        limit = parse_limit(params.get('limit'))
+        fields = parse_fields(params.get('fields'))
+        sort, descending = parse_sort(params.get('sort'))
+        cursor = decode_cursor(params['cursor'], sort) if params.get('cursor') else None
+        expires_after = _parse_datetime(params.get('expires_after'), 'expires_after')
+        expires_before = _parse_datetime(params.get('expires_before'), 'expires_before')
+        min_prize_pool = _parse_float(params.get('min_prize_pool'), 'min_prize_pool')
+        max_prize_pool = _parse_float(params.get('max_prize_pool'), 'max_prize_pool')
+
+        keyed = []
+        for agent, data in self._agents:
+            prize_pool = self._prize_pools.get(agent.wallet_address, 0)
+            if expires_after and agent.expires_at <= expires_after:
+                continue
+            if expires_before and agent.expires_at >= expires_before:
+                continue
+            if min_prize_pool is not None and prize_pool < min_prize_pool:
+                continue
+            if max_prize_pool is not None and prize_pool > max_prize_pool:
+                continue
+            value = prize_pool if sort == 'prize_pool' else getattr(agent, sort)
+            keyed.append(((value, agent.id), data, prize_pool))
+
+        # The snapshot is already in (created_at, id) order
+        if sort != 'created_at':
+            keyed.sort(key=lambda item: item[0])
+        if descending:
+            keyed.reverse()
+        if cursor is not None:
+            keyed = [item for item in keyed if _after_cursor(item[0], cursor, descending)]
+
+        page = keyed[:limit]
+        next_cursor = None
+        if len(keyed) > limit:
+            (value, agent_id), _, _ = page[-1]
+            next_cursor = encode_cursor(sort, value, agent_id)
+
+        agents = []
+        for _, data, prize_pool in page:
+            agent = {key: value for key, value in data.items() if key not in DETAIL_FIELDS or key in fields}
+            agent['prize_pool'] = prize_pool
+            agents.append(agent)
+        return {'agents': agents, 'next_cursor': next_cursor}
+
+    def render_page(self, params) -> bytes:
+        """The list_agents response body for a page, cached per snapshot version."""
+        key = (self.etag, params.urlencode())
+        body = self._pages.get(key)
+        if body is not None:
+            self._pages.move_to_end(key)
+            self.page_hits += 1
+            return body
+
+        self.page_misses += 1
+        page = self.page(params)
+        body = json.dumps({
+            'success': True,
+            'agents': page['agents'],
+            'next_cursor': page['next_cursor']
+        }).encode()
+        self._pages[key] = body
+        if len(self._pages) > settings.CATALOGUE_PAGE_CACHE_SIZE:
+            self._pages.popitem(last=False)
+        return body
+
+    async def run_refresher(self, interval: float = None) -> None:
+        """Keep the snapshot and its prize pools fresh so reads never wait on them."""
+        interval = interval or settings.CATALOGUE_REFRESH_INTERVAL
+        self._refresher_running = True
+        try:
+            while True:
+                try:
+                    await self._check_generation()
+                    if self._is_stale():
+                        await self.rebuild()
+                    else:
+                        await self.refresh_prize_pools()
+                except Exception:
+                    logger.exception("Error refreshing agent catalogue")
+                await asyncio.sleep(interval)
+        finally:
+            self._refresher_running = False
+
+    def stats(self) -> dict:
+        return {
+            'agents': len(self._agents or ()),
+            'rebuilds': self.rebuilds,
+            'prize_pool_refreshes': self.prize_pool_refreshes,
+            'page_hits': self.page_hits,
+            'page_misses': self.page_misses,
+        }
+
+
+catalogue = Catalogue()
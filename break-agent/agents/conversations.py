@@ -0,0 +1,84 @@
+"""
+Reading and appending conversation messages.
+
+Each message is its own ChatMessage row, so a turn inserts two small rows
+instead of rewriting the whole conversation, and a read only loads the most
+recent messages. The system prompt is the agent's compiled prompt (see
+agents/prompts.py) and is prepended on read rather than stored.
+"""
+from typing import Dict, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Agent, ChatHistory, ChatMessage, User
+
+
+async def aget_context_messages(chat_history: ChatHistory, system_prompt: str, limit: int) -> List[Dict]:
+    """
+    Return the system prompt followed by (up to) the last `limit` messages of
+    a conversation, oldest first, as chat message dicts.
+    """
+    # Start the window on a multiple of CHAT_CONTEXT_TRIM_BLOCK so it only
+    # moves every block of messages, keeping the prompt prefix cacheable
+    block = settings.CHAT_CONTEXT_TRIM_BLOCK
+    start = max(chat_history.message_count - limit, 0)
+    start = -(-start // block) * block
+    rows = ChatMessage.objects.filter(
+        conversation=chat_history,
+        # The partition keys, so only the conversation's partition is read
+        agent_id=chat_history.agent_id,
+        conversation_started_at=chat_history.started_at,
+        sequence__gte=start
+    ).order_by('sequence').values_list('role', 'content')
+    return [{"role": "system", "content": system_prompt}] + [
+        {"role": role, "content": content} async for role, content in rows
+    ]
+
+
+def append_messages(chat_history: ChatHistory, messages: List[Dict]) -> None:
+    """
+    Append messages to a conversation. Assistant messages may carry the
+    completion's prompt_tokens, cached_tokens and completion_tokens.
+
+    Sequence numbers are reserved by incrementing message_count in the same
+    transaction, so concurrent turns on one conversation are serialized by the
+    row lock instead of overwriting each other.
+    """
+    with transaction.atomic():
+        ChatHistory.objects.filter(pk=chat_history.pk).update(message_count=F('message_count') + len(messages))
+        end = ChatHistory.objects.values_list('message_count', flat=True).get(pk=chat_history.pk)
+        start = end - len(messages)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                conversation_id=chat_history.pk,
+                agent_id=chat_history.agent_id,
+                conversation_started_at=chat_history.started_at,
+                sequence=start + i,
+                role=message["role"],
+                content=message["content"],
+                prompt_tokens=message.get("prompt_tokens"),
+                cached_tokens=message.get("cached_tokens"),
+                completion_tokens=message.get("completion_tokens")
+            )
+            for i, message in enumerate(messages)
+        ])
+    chat_history.message_count = end
+
+
+aappend_messages = sync_to_async(append_messages)
+
+
+def get_or_start_conversation(agent: Agent, user: User) -> ChatHistory:
+    """
+    Get the conversation between an agent and a user, starting it if it
+    doesn't exist yet. The unique (agent, user) constraint makes concurrent
+    first requests end up with the same conversation.
+    """
+    chat_history, _ = ChatHistory.objects.get_or_create(agent=agent, user=user)
+    return chat_history
+
+
+aget_or_start_conversation = sync_to_async(get_or_start_conversation)
@@ -0,0 +1,347 @@
+"""
+A small local stand-in for the Solana JSON-RPC API.
+
+Only the methods the agents app actually uses are implemented, backed by an
+in-memory ledger: lamport balances, blockhashes and the transactions sent.
+It speaks plain HTTP/1.1 with keep-alive so it can be pointed at by httpx or
+solana-py exactly like a real endpoint.
+
+The ledger moves on in real time, one block every `slot_time` seconds, so
+blockhashes expire and sent transactions go from processed to confirmed to
+finalized as they would on a cluster. Latency, failing requests (HTTP 503)
+and rate limiting (HTTP 429) can be injected to see how the app copes.
+
+Benchmarks start one in-process. To run the whole stack offline, start
+`manage.py run_fake_rpc` and set SOLANA_RPC_URL to its address.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from solders.hash import Hash
+from solders.signature import Signature
+from solders.system_program import ID as SYSTEM_PROGRAM_ID
+from solders.transaction import Transaction
+
+# A blockhash can be used for this many blocks after the one it was issued at
+BLOCKHASH_VALIDITY = 150
+# Blocks after which a transaction is finalized rather than just confirmed
+FINALIZED_DEPTH = 32
+LAMPORTS_PER_SIGNATURE = 5000
+# Index of the Transfer instruction in the system program
+SYSTEM_TRANSFER = 2
+
+FAKE_RPC_SETTINGS = {
+    'latency': 'FAKE_SOLANA_RPC_LATENCY',
+    'jitter': 'FAKE_SOLANA_RPC_JITTER',
+    'error_rate': 'FAKE_SOLANA_RPC_ERROR_RATE',
+    'requests_per_second': 'FAKE_SOLANA_RPC_REQUESTS_PER_SECOND',
+    'slot_time': 'FAKE_SOLANA_RPC_SLOT_TIME',
+}
+
+
+class RPCMethodError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeSolanaRPC:
+    """
+    In-memory JSON-RPC server.
+
+    Usage:
+        rpc = FakeSolanaRPC(balances={address: lamports})
+        await rpc.start()
+        ... point clients at rpc.url ...
+        await rpc.stop()
+
+    Args:
+        latency: Seconds each HTTP request takes to answer
+        jitter: Up to this many seconds added at random to the latency
+        error_rate: Fraction of HTTP requests answered with a 503
+        requests_per_second: HTTP requests allowed per second before the
+                             rest get a 429 (0 = unlimited)
+        slot_time: Seconds per block
+    """
+
+    def __init__(self, balances: Optional[Dict[str, int]] = None, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 requests_per_second: float = 0, slot_time: float = 0.4):
+        self.balances: Dict[str, int] = dict(balances or {})
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_per_second = requests_per_second
+        self.slot_time = slot_time
+        self.request_count = 0
+        self.method_counts: Dict[str, int] = {}
+        self.failed_count = 0
+        self.rate_limited_count = 0
+        # signature -> slot the transaction landed in
+        self.transactions: Dict[str, int] = {}
+        # blockhash -> last block height it is valid for
+        self.blockhashes: Dict[str, int] = {}
+        self._started_at = time.monotonic()
+        self._window = (0, 0)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @classmethod
+    def from_settings(cls, **kwargs) -> "FakeSolanaRPC":
+        """Build one with the FAKE_SOLANA_RPC_* settings, overridden by kwargs."""
+        for name, setting in FAKE_RPC_SETTINGS.items():
+            kwargs.setdefault(name, getattr(settings, setting))
+        return cls(**kwargs)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    # Ledger
+
+    @property
+    def block_height(self) -> int:
+        return int((time.monotonic() - self._started_at) / self.slot_time) + 1
+
+    def _context(self) -> Dict[str, Any]:
+        return {"slot": self.block_height}
+
+    def _blockhash(self, height: int) -> str:
+        return str(Hash(hashlib.sha256(f"fake-blockhash-{height}".encode()).digest()))
+
+    def _status(self, slot: int) -> Dict[str, Any]:
+        depth = self.block_height - slot
+        if depth >= FINALIZED_DEPTH:
+            return {"slot": slot, "confirmations": None, "err": None, "status": {"Ok": None},
+                    "confirmationStatus": "finalized"}
+        return {"slot": slot, "confirmations": depth, "err": None, "status": {"Ok": None},
+                "confirmationStatus": "confirmed" if depth else "processed"}
+
+    def _decode_transaction(self, data: str, encoding: str) -> Transaction:
+        # base58, the API's deprecated default, isn't supported; both clients the app uses send base64
+        if encoding != "base64":
+            raise RPCMethodError(-32602, f"unsupported encoding: {encoding}. Supported encodings: base64")
+        try:
+            transaction = Transaction.from_bytes(base64.b64decode(data))
+        except Exception:
+            raise RPCMethodError(-32602, f"invalid transaction: failed to deserialize ({encoding})")
+        try:
+            transaction.verify()
+        except Exception:
+            raise RPCMethodError(-32003, "Transaction signature verification failure")
+        return transaction
+
+    def _debit(self, changes: Dict[str, int], address: str, lamports: int) -> None:
+        balance = self.balances.get(address, 0) + changes.get(address, 0)
+        if balance < lamports:
+            if address not in self.balances:
+                raise RPCMethodError(-32002, "Transaction simulation failed: Attempt to debit an account "
+                                             "but found no record of a prior credit.")
+            raise RPCMethodError(-32002, "Transaction simulation failed: Error processing Instruction 0: "
+                                         "custom program error: 0x1")
+        changes[address] = changes.get(address, 0) - lamports
+
+    # JSON-RPC methods
+
+    def get_balance(self, params: List[Any]) -> Dict[str, Any]:
+        address = params[0]
+        return {"context": self._context(), "value": self.balances.get(address, 0)}
+
+    def get_multiple_accounts(self, params: List[Any]) -> Dict[str, Any]:
+        addresses = params[0]
+        if len(addresses) > 100:
+            raise RPCMethodError(-32602, "Too many inputs provided; max 100")
+        value = []
+        for address in addresses:
+            lamports = self.balances.get(address)
+            if lamports is None:
+                value.append(None)
+            else:
+                value.append({
+                    "lamports": lamports,
+                    "owner": "11111111111111111111111111111111",
+                    "data": ["", "base64"],
+                    "executable": False,
+                    "rentEpoch": 0,
+                    "space": 0,
+                })
+        return {"context": self._context(), "value": value}
+
+    def get_block_height(self, params: List[Any]) -> int:
+        return self.block_height
+
+    def get_latest_blockhash(self, params: List[Any]) -> Dict[str, Any]:
+        height = self.block_height
+        blockhash = self._blockhash(height)
+        self.blockhashes[blockhash] = height + BLOCKHASH_VALIDITY
+        # Forget the ones that have expired
+        for expired in [key for key, last_valid in self.blockhashes.items() if last_valid < height]:
+            del self.blockhashes[expired]
+        return {
+            "context": self._context(),
+            "value": {"blockhash": blockhash, "lastValidBlockHeight": height + BLOCKHASH_VALIDITY},
+        }
+
+    def send_transaction(self, params: List[Any]) -> str:
+        options = params[1] if len(params) > 1 else {}
+        transaction = self._decode_transaction(params[0], options.get("encoding", "base58"))
+        signature = str(transaction.signatures[0])
+        if signature in self.transactions:
+            raise RPCMethodError(-32002, "Transaction simulation failed: This transaction has already been processed")
+        message = transaction.message
+        last_valid = self.blockhashes.get(str(message.recent_blockhash))
+        if last_valid is None or last_valid < self.block_height:
+            raise RPCMethodError(-32002, "Transaction simulation failed: Blockhash not found")
+
+        # Work out every balance change before applying any, so a failed transaction changes nothing
+        keys = [str(key) for key in message.account_keys]
+        changes: Dict[str, int] = {}
+        self._debit(changes, keys[0], LAMPORTS_PER_SIGNATURE * len(transaction.signatures))
+        for instruction in message.instructions:
+            if message.account_keys[instruction.program_id_index] != SYSTEM_PROGRAM_ID:
+                continue
+            data = bytes(instruction.data)
+            if len(data) == 12 and struct.unpack_from("<I", data)[0] == SYSTEM_TRANSFER:
+                lamports = struct.unpack_from("<Q", data, 4)[0]
+                source, destination = (keys[index] for index in bytes(instruction.accounts)[:2])
+                self._debit(changes, source, lamports)
+                changes[destination] = changes.get(destination, 0) + lamports
+        for address, change in changes.items():
+            self.balances[address] = self.balances.get(address, 0) + change
+
+        self.transactions[signature] = self.block_height
+        return signature
+
+    def get_signature_statuses(self, params: List[Any]) -> Dict[str, Any]:
+        signatures = params[0]
+        if len(signatures) > 256:
+            raise RPCMethodError(-32602, "Too many inputs provided; max 256")
+        value = []
+        for signature in signatures:
+            slot = self.transactions.get(signature)
+            value.append(None if slot is None else self._status(slot))
+        return {"context": self._context(), "value": value}
+
+    def request_airdrop(self, params: List[Any]) -> str:
+        address, lamports = params[0], int(params[1])
+        self.balances[address] = self.balances.get(address, 0) + lamports
+        signature = str(Signature(hashlib.sha512(f"airdrop-{address}-{self.request_count}".encode()).digest()))
+        self.transactions[signature] = self.block_height
+        return signature
+
+    METHODS = {
+        "getBalance": get_balance,
+        "getMultipleAccounts": get_multiple_accounts,
+        "getBlockHeight": get_block_height,
+        "getLatestBlockhash": get_latest_blockhash,
+        "sendTransaction": send_transaction,
+        "getSignatureStatuses": get_signature_statuses,
+        "requestAirdrop": request_airdrop,
+    }
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.method_counts[request.get("method")] = self.method_counts.get(request.get("method"), 0) + 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        handler = self.METHODS.get(request.get("method"))
+        if handler is None:
+            response["error"] = {"code": -32601, "message": "Method not found"}
+            return response
+        try:
+            response["result"] = handler(self, request.get("params") or [])
+        except RPCMethodError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+        return response
+
+    async def handle_payload(self, payload: Any) -> Any:
+        self.request_count += 1
+        if isinstance(payload, list):
+            return [self.dispatch(request) for request in payload]
+        return self.dispatch(payload)
+
+    # Fault injection
+
+    def _rate_limited(self) -> bool:
+        if not self.requests_per_second:
+            return False
+        second, count = self._window
+        now = int(time.monotonic())
+        if now != second:
+            second, count = now, 0
+        self._window = (second, count + 1)
+        return count >= self.requests_per_second
+
+    async def _injected_response(self) -> Optional[bytes]:
+        """Wait out the latency, then return an error response to send instead of the result, if any."""
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self._rate_limited():
+            self.rate_limited_count += 1
+            return b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 1\r\n"
+        if self.error_rate and random.random() < self.error_rate:
+            self.failed_count += 1
+            return b"HTTP/1.1 503 Service Unavailable\r\n"
+        return None
+
+    # HTTP plumbing
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status = await self._injected_response()
+                if status is None:
+                    try:
+                        result = await self.handle_payload(json.loads(body))
+                    except json.JSONDecodeError:
+                        result = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}}
+                    status = b"HTTP/1.1 200 OK\r\n"
+                    data = json.dumps(result).encode()
+                else:
+                    data = b""
+
+                writer.write(
+                    status
+                    + b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,59 @@
+"""
+ASGI lifespan support for the agents app.
+
+Django's ASGI handler ignores lifespan events, so LifespanMiddleware answers
+them itself and runs startup()/shutdown() around the worker's lifetime. All
+other scopes are passed through to the wrapped application.
+"""
+import asyncio
+
+from . import rpc
+from ._agent.chat import load_encoding
+from .catalogue import catalogue
+
+_background_tasks = []
+
+
+async def startup():
+    # Open the shared RPC client on the server's loop so the first request
+    # doesn't pay for creating it
+    rpc.get_client()
+    # Load the tokenizer before taking requests; it may have to download its encoding
+    await asyncio.to_thread(load_encoding)
+    # Keep the agent catalogue and its prize pools fresh off the request path
+    _background_tasks.append(asyncio.ensure_future(catalogue.run_refresher()))
+
+
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await rpc.aclose()
+
+
+class LifespanMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await shutdown()
+                except Exception as e:
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,133 @@
+"""
+Logging for the agents app, configured through settings.LOGGING.
+
+- BackgroundHandler puts records on a queue and writes them from a
+  background thread, so logging never blocks a request on stdout.
+- JsonFormatter writes one JSON object per line, with any `extra` fields.
+- RedactFilter masks fields that may hold prompts, chat content or keys
+  (LOG_REDACT_FIELDS), and private keys in the message, exception or other
+  fields. Only strings that decode to a valid keypair are masked, so
+  transaction signatures and addresses are left alone.
+- SampleFilter keeps only LOG_SAMPLE_RATE of records below WARNING, so busy
+  paths can log per request without flooding the output.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+from django.conf import settings
+from solders.keypair import Keypair
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Candidates for 64-byte secret keys, hex (as generate_wallet writes them) or
+# base58. Signatures look the same, so each match is checked by _is_private_key.
+_PRIVATE_KEY = re.compile(r'\b(?:[0-9a-fA-F]{128}|[1-9A-HJ-NP-Za-km-z]{86,88})\b')
+
+REDACTED = '[redacted]'
+
+
+def _extra(record: logging.LogRecord) -> dict:
+    return {name: value for name, value in vars(record).items() if name not in _RECORD_ATTRIBUTES}
+
+
+def _is_private_key(text: str) -> bool:
+    """Whether text is a keypair: a secret key followed by the public key derived from it."""
+    try:
+        if len(text) == 128:
+            Keypair.from_bytes(bytes.fromhex(text))
+        else:
+            Keypair.from_base58_string(text)
+    except Exception:
+        return False
+    return True
+
+
+def redact_keys(text: str) -> str:
+    return _PRIVATE_KEY.sub(lambda match: REDACTED if _is_private_key(match.group()) else match.group(), text)
+
+
+class RedactFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = set(settings.LOG_REDACT_FIELDS)
+        for name, value in _extra(record).items():
+            if name in fields:
+                setattr(record, name, REDACTED)
+            elif isinstance(value, str):
+                setattr(record, name, redact_keys(value))
+        # Redact the message with its arguments filled in, as it will be output
+        record.msg = redact_keys(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact_keys(record.exc_text)
+            # Formatters output exc_text when set; drop the live exception so the
+            # unredacted traceback can't be formatted again
+            record.exc_info = None
+        if record.stack_info:
+            record.stack_info = redact_keys(record.stack_info)
+        return True
+
+
+class SampleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = settings.LOG_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_extra(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    Queue records and write them to `stream` (stdout by default) from a
+    background thread. The formatter and filters set on this handler are
+    applied before queueing; the writing thread only does the I/O.
+    """
+
+    def __init__(self, stream=None, max_queue: int = 10000):
+        super().__init__(queue.Queue(max_queue))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Drop rather than block the request if the writer has fallen behind
+            pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format here, where the record's arguments and exception are still
+        # live; the writer thread then outputs the string as is
+        message = self.format(record)
+        record = logging.makeLogRecord({'msg': message, 'levelno': record.levelno,
+                                        'levelname': record.levelname, 'name': record.name})
+        return record
@@ -0,0 +1,228 @@
+import asyncio
+import itertools
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+from agents import rpc
+from agents.bench import (
+    asgi_request, count_queries, pooled_wallets, query_counter, return_claimed_wallets, run_load, summarize
+)
+from agents.catalogue import bump_generation
+from agents.fake_rpc import FakeSolanaRPC
+from agents.models import Agent, User
+from agents.prompts import compile_prompt
+from agents.solana import generate_wallet
+from break_agent.asgi import django_application
+
+BENCH_PREFIX = 'bench-api-'
+BENCH_CREATOR = f'{BENCH_PREFIX}creator'
+ENDPOINTS = ('users/create', 'agents/create', 'agents/list', 'agents/chat')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the agents API end to end with no network access, against a local '
+        'fake Solana RPC and the mock LLM provider. Reports latency percentiles, '
+        'throughput and DB queries per request for each endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Comma-separated endpoints to run, from: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+        parser.add_argument('--seed-agents', type=int, default=200, help='Agents to create for agents/list')
+        parser.add_argument('--llm-latency', type=float, default=0.2, help='Mock provider seconds before the first token')
+        parser.add_argument('--llm-tokens-per-second', type=float, default=200, help='Mock provider token rate')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='A previous --output file to compare against')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint.strip() for endpoint in options['endpoints'].split(',') if endpoint.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        pooled = pooled_wallets()
+        with override_settings(
+            LLM_PROVIDER='mock',
+            MOCK_LLM_LATENCY=options['llm_latency'],
+            MOCK_LLM_TOKENS_PER_SECOND=options['llm_tokens_per_second'],
+            MOCK_LLM_REQUESTS_PER_MINUTE=0,
+            # Measure the endpoints, not the attempt limits
+            CHAT_RATE_LIMIT=0,
+            CHAT_COOLDOWN=0,
+        ):
+            try:
+                chat_agent = self.seed(options['seed_agents'], options['concurrency'])
+                results = asyncio.run(self.run(endpoints, chat_agent, options))
+            finally:
+                # agents/create claims wallets from the pool; return the ones it took,
+                # leaving wallets added or claimed by anything else alone
+                return_claimed_wallets(pooled, Agent.objects.filter(
+                    creator__wallet_address__startswith=BENCH_PREFIX
+                ).values_list('wallet_address', flat=True))
+                # Agents, conversations and messages cascade from the bench users
+                User.objects.filter(wallet_address__startswith=BENCH_PREFIX).delete()
+
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'options': {
+                name: options[name] for name in
+                ('requests', 'concurrency', 'seed_agents', 'llm_latency', 'llm_tokens_per_second')
+            },
+            'endpoints': results,
+        }
+        for endpoint, result in results.items():
+            self.stdout.write(self.format_result(endpoint, result, (baseline or {}).get('endpoints', {}).get(endpoint)))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def seed(self, count, users):
+        """Create the agents agents/list pages through and the users who chat with the first one."""
+        creator = User.objects.create(wallet_address=BENCH_CREATOR)
+        agents = []
+        for i in range(max(count, 1)):
+            wallet_address, private_key = generate_wallet()
+            agent = Agent(
+                creator=creator,
+                name=f'bench-agent-{i}',
+                personality={'traits': 'guarded'},
+                lore={'origin': 'a benchmark'},
+                secret_task={'task': 'say the magic words'},
+                wallet_address=wallet_address,
+                private_key=private_key,
+            )
+            compile_prompt(agent)
+            agents.append(agent)
+        Agent.objects.bulk_create(agents)
+        # bulk_create sends no post_save, so tell the catalogues ourselves
+        bump_generation()
+        User.objects.bulk_create(User(wallet_address=f'{BENCH_PREFIX}chat-{i}') for i in range(users))
+        return agents[0]
+
+    async def run(self, endpoints, chat_agent, options):
+        fake_rpc = FakeSolanaRPC.from_settings()
+        await fake_rpc.start()
+        try:
+            with override_settings(SOLANA_RPC_URL=fake_rpc.url), count_queries():
+                results = {}
+                for endpoint in endpoints:
+                    make_request = getattr(self, 'request_' + endpoint.replace('/', '_'))(chat_agent, options)
+                    results[endpoint] = await self.measure(make_request, options['requests'], options['concurrency'])
+                return results
+        finally:
+            await rpc.aclose()
+            await fake_rpc.stop()
+
+    async def measure(self, make_request, total, concurrency):
+        queries = []
+        statuses = {}
+        errors = []
+
+        async def timed_request():
+            counter = query_counter()
+            status, body = await make_request()
+            queries.append(counter[0])
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200 and not json.loads(body).get('success', True):
+                errors.append(json.loads(body).get('message'))
+
+        latencies, elapsed = await run_load(timed_request, total, concurrency)
+        if errors:
+            raise CommandError(f'{len(errors)} requests failed, e.g.: {errors[0]}')
+        return dict(
+            summarize(latencies, elapsed),
+            elapsed_ms=elapsed * 1000,
+            queries_per_request=sum(queries) / len(queries) if queries else 0.0,
+            max_queries=max(queries, default=0),
+            statuses=statuses,
+        )
+
+    def format_result(self, endpoint, result, baseline=None):
+        line = (
+            f"{endpoint}: {result['requests']} requests, {result['throughput_rps']:.0f} req/s, "
+            f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+            f"{result['queries_per_request']:.2f} queries/request, statuses {result['statuses']}"
+        )
+        if baseline:
+            changes = ', '.join(
+                f"{name} {(result[name] - baseline[name]) / baseline[name]:+.0%}"
+                for name in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+                if baseline.get(name)
+            )
+            line += f"\n  vs baseline: {changes}"
+        return line
+
+    def request_users_create(self, chat_agent, options):
+        path = reverse('create_user')
+        numbers = itertools.count()
+
+        async def make_request():
+            status, _, body = await asgi_request(django_application, 'POST', path, form={
+                'wallet_address': f'{BENCH_PREFIX}user-{next(numbers)}',
+            })
+            return status, body
+        return make_request
+
+    def request_agents_create(self, chat_agent, options):
+        path = reverse('create_agent')
+
+        async def make_request():
+            status, _, body = await asgi_request(django_application, 'POST', path, form={
+                'wallet_address': BENCH_CREATOR,
+                'name': 'bench-created-agent',
+                'personality': json.dumps({'traits': 'terse'}),
+            })
+            return status, body
+        return make_request
+
+    def request_agents_list(self, chat_agent, options):
+        path = reverse('list_agents')
+        # Walk through the pages of the catalogue, starting over at the end
+        cursors = [None]
+
+        async def make_request():
+            cursor = cursors[-1]
+            params = {'limit': 20, 'fields': 'personality,lore'}
+            if cursor:
+                params['cursor'] = cursor
+            status, _, body = await asgi_request(django_application, 'GET', path, params=params)
+            if status == 200:
+                cursors.append(json.loads(body).get('next_cursor'))
+            return status, body
+        return make_request
+
+    def request_agents_chat(self, chat_agent, options):
+        path = reverse('get_agent_response')
+        idle_users = asyncio.Queue()
+        for i in range(options['concurrency']):
+            idle_users.put_nowait(f'{BENCH_PREFIX}chat-{i}')
+
+        async def make_request():
+            # A user's turns are sent one at a time, like a real chat client
+            user = await idle_users.get()
+            try:
+                status, _, body = await asgi_request(django_application, 'POST', path, form={
+                    'agent_wallet': chat_agent.wallet_address,
+                    'user_wallet': user,
+                    'message': 'What are you guarding?',
+                })
+                return status, body
+            finally:
+                idle_users.put_nowait(user)
+        return make_request
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from solders.keypair import Keypair
+
+from agents import rpc
+from agents.balances import get_solana_balance, get_solana_balances
+from agents.fake_rpc import FakeSolanaRPC
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-wallet vs batched balance lookups against a local fake RPC server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=1000, help='Number of agent wallets to look up')
+        parser.add_argument('--skip-sequential', action='store_true', help='Only run the batched lookup')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['agents'], options['skip_sequential']))
+
+    async def run(self, count, skip_sequential):
+        addresses = [str(Keypair().pubkey()) for _ in range(count)]
+        fake_rpc = FakeSolanaRPC.from_settings(balances={address: (i + 1) * 1000 for i, address in enumerate(addresses)})
+        await fake_rpc.start()
+
+        try:
+            with override_settings(SOLANA_RPC_URL=fake_rpc.url):
+                await self.compare(addresses, fake_rpc, skip_sequential)
+        finally:
+            await rpc.aclose()
+            await fake_rpc.stop()
+
+    async def compare(self, addresses, fake_rpc, skip_sequential):
+        count = len(addresses)
+
+        if not skip_sequential:
+            fake_rpc.request_count = 0
+            start = time.perf_counter()
+            for address in addresses:
+                await get_solana_balance(address)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'sequential getBalance: {count} wallets in {elapsed * 1000:.1f} ms '
+                f'({fake_rpc.request_count} RPC calls)'
+            )
+
+        fake_rpc.request_count = 0
+        start = time.perf_counter()
+        balances = await get_solana_balances(addresses)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'batched getMultipleAccounts: {count} wallets in {elapsed * 1000:.1f} ms '
+            f'({fake_rpc.request_count} RPC calls)'
+        )
+
+        missing = [address for address in addresses if not balances[address]]
+        if missing:
+            self.stdout.write(self.style.ERROR(f'{len(missing)} wallets resolved to 0'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All balances resolved'))
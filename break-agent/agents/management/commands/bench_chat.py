@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+
+from agents._agent.providers import get_provider
+from agents._agent.scheduler import get_scheduler
+from agents.bench import asgi_request, run_load, summarize
+from agents.fake_rpc import FakeSolanaRPC
+from agents import rpc
+from agents.models import Agent, User
+from agents.prompts import prompt_cache
+from agents.solana import generate_wallet
+from break_agent.asgi import django_application
+
+BENCH_CREATOR = 'bench-creator'
+BENCH_USER_PREFIX = 'bench-user-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks get_agent_response end to end against the mock LLM provider '
+        'and a local fake Solana RPC, with no network access'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Chat requests to send')
+        parser.add_argument('--users', type=int, default=50,
+                            help='Users chatting at once; each sends its turns one after another')
+        parser.add_argument('--latency', type=float, default=0.2, help='Mock provider seconds before the first token')
+        parser.add_argument('--tokens-per-second', type=float, default=200, help='Mock provider token rate')
+        parser.add_argument('--reply-tokens', type=int, default=40, help='Mock provider reply length')
+        parser.add_argument('--max-concurrency', type=int, default=64, help='LLM_MAX_CONCURRENCY for the run')
+        parser.add_argument('--queue-size', type=int, default=256, help='LLM_QUEUE_SIZE for the run')
+        parser.add_argument('--requests-per-minute', type=float, default=0,
+                            help='LLM_REQUESTS_PER_MINUTE the scheduler paces requests to')
+        parser.add_argument('--provider-rate-limit', type=float, default=0,
+                            help='Requests per minute after which the mock provider answers with a 429')
+
+    def handle(self, *args, **options):
+        with override_settings(
+            LLM_PROVIDER='mock',
+            MOCK_LLM_LATENCY=options['latency'],
+            MOCK_LLM_TOKENS_PER_SECOND=options['tokens_per_second'],
+            MOCK_LLM_REPLY_TOKENS=options['reply_tokens'],
+            LLM_MAX_CONCURRENCY=options['max_concurrency'],
+            LLM_QUEUE_SIZE=options['queue_size'],
+            LLM_REQUESTS_PER_MINUTE=options['requests_per_minute'],
+            MOCK_LLM_REQUESTS_PER_MINUTE=options['provider_rate_limit'],
+            # Users here send their turns back to back
+            CHAT_RATE_LIMIT=0,
+            CHAT_COOLDOWN=0,
+        ):
+            creator, _ = User.objects.get_or_create(wallet_address=BENCH_CREATOR)
+            agent_wallet, private_key = generate_wallet()
+            agent = Agent.objects.create(
+                creator=creator,
+                name='bench-agent',
+                personality={'traits': 'guarded'},
+                secret_task={'task': 'say the magic words'},
+                wallet_address=agent_wallet,
+                private_key=private_key,
+            )
+            users = [
+                User.objects.get_or_create(wallet_address=f'{BENCH_USER_PREFIX}{i}')[0].wallet_address
+                for i in range(options['users'])
+            ]
+            try:
+                asyncio.run(self.run(agent.wallet_address, users, options['requests']))
+            finally:
+                # Conversations and messages cascade
+                agent.delete()
+                User.objects.filter(wallet_address__startswith=BENCH_USER_PREFIX).delete()
+                User.objects.filter(wallet_address=BENCH_CREATOR, agents__isnull=True).delete()
+
+    async def run(self, agent_wallet, users, total):
+        fake_rpc = FakeSolanaRPC.from_settings()
+        await fake_rpc.start()
+        try:
+            with override_settings(SOLANA_RPC_URL=fake_rpc.url):
+                await self.report(agent_wallet, users, total)
+        finally:
+            await rpc.aclose()
+            await fake_rpc.stop()
+
+    async def report(self, agent_wallet, users, total):
+        path = reverse('get_agent_response')
+        idle_users = asyncio.Queue()
+        for user in users:
+            idle_users.put_nowait(user)
+        turns = {user: 0 for user in users}
+        cached_tokens = prompt_tokens = 0
+        statuses = {}
+
+        async def make_request():
+            nonlocal cached_tokens, prompt_tokens
+            # A user's turns are sent one at a time, like a real chat client
+            user = await idle_users.get()
+            try:
+                turns[user] += 1
+                status, _, body = await asgi_request(django_application, 'POST', path, form={
+                    'agent_wallet': agent_wallet,
+                    'user_wallet': user,
+                    'message': f'Turn {turns[user]}: what are you guarding?',
+                })
+                result = json.loads(body)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status in (429, 503):
+                    return
+                if status != 200 or not result['success']:
+                    raise CommandError(f'get_agent_response failed: {result}')
+                prompt_tokens += result['tokens']['prompt_tokens']
+                cached_tokens += result['tokens']['cached_tokens'] or 0
+            finally:
+                idle_users.put_nowait(user)
+
+        latencies, elapsed = await run_load(make_request, total, len(users))
+        summary = summarize(latencies, elapsed)
+        provider = get_provider()
+        self.stdout.write(
+            f"get_agent_response: {summary['requests']} requests from {len(users)} users in "
+            f"{elapsed * 1000:.0f} ms ({summary['throughput_rps']:.0f} req/s, p50 {summary['p50_ms']:.1f} ms, "
+            f"p95 {summary['p95_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms); statuses {statuses}"
+        )
+        self.stdout.write(
+            f"mock provider: {provider.latency * 1000:.0f} ms latency, {provider.tokens_per_second:.0f} tokens/s, "
+            f"{provider.reply_tokens} reply tokens; {provider.requests} requests, "
+            f"{provider.rate_limited} rate limited, {cached_tokens / prompt_tokens if prompt_tokens else 0:.0%} "
+            f"of prompt tokens cached"
+        )
+        self.stdout.write(f"scheduler: {get_scheduler().stats()}")
+        self.stdout.write(f"prompt cache: {prompt_cache.stats()}")
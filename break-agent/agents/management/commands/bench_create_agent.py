@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+
+from agents.bench import asgi_request, pooled_wallets, return_claimed_wallets, run_load, summarize
+from agents.models import Agent, PooledWallet, User
+from agents.wallet_pool import refill
+from break_agent.asgi import django_application
+
+BENCH_CREATOR = 'bench-creator'
+BENCH_AGENT_NAME = 'bench-agent'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks create_agent under concurrent creators, generating wallets '
+        'inline vs claiming them from a pre-filled wallet pool'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=200, help='Agents to create per run')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent creators')
+
+    def handle(self, *args, **options):
+        if not settings.WALLET_POOL_ENCRYPTION_KEY:
+            raise CommandError('WALLET_POOL_ENCRYPTION_KEY must be set to benchmark the wallet pool')
+        User.objects.get_or_create(wallet_address=BENCH_CREATOR)
+        # Wallet addresses of the agents each run created
+        self.created = []
+        # Only wallets that were in the pool before the run go back into it
+        pooled = pooled_wallets()
+        available = {}
+        try:
+            # Without a key the pool isn't used, so every wallet is generated inline
+            with override_settings(WALLET_POOL_ENCRYPTION_KEY=None):
+                self.report('inline wallet generation', options)
+
+            refill(PooledWallet.objects.count() + options['agents'])
+            available = pooled_wallets()
+            self.created = []
+            self.report('wallet pool', options)
+            generated = sum(1 for address in self.created if address not in available)
+            if generated:
+                raise CommandError(f'{generated} creations generated a wallet instead of claiming one')
+        finally:
+            # Put back what this run claimed; wallets other processes added or
+            # claimed meanwhile are left alone
+            return_claimed_wallets(pooled, self.created)
+            # and drop the ones it generated for itself but didn't use
+            PooledWallet.objects.filter(
+                wallet_address__in=set(available) - set(pooled) - set(self.created)
+            ).delete()
+            Agent.objects.filter(creator__wallet_address=BENCH_CREATOR, name=BENCH_AGENT_NAME).delete()
+            User.objects.filter(wallet_address=BENCH_CREATOR).delete()
+
+    def report(self, label, options):
+        latencies, elapsed = asyncio.run(self.run(options['agents'], options['concurrency']))
+        summary = summarize(latencies, elapsed)
+        self.stdout.write(
+            f"{label}: {summary['requests']} agents in {elapsed * 1000:.0f} ms "
+            f"({summary['throughput_rps']:.0f} agents/s, p50 {summary['p50_ms']:.1f} ms, "
+            f"p95 {summary['p95_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms)"
+        )
+
+    async def run(self, total, concurrency):
+        path = reverse('create_agent')
+
+        async def make_request():
+            status, _, body = await asgi_request(django_application, 'POST', path, form={
+                'wallet_address': BENCH_CREATOR,
+                'name': BENCH_AGENT_NAME,
+                'personality': json.dumps({'traits': 'terse'}),
+            })
+            result = json.loads(body)
+            if status != 200 or not result['success']:
+                raise CommandError(f'create_agent failed: {result}')
+
+        agents = Agent.objects.filter(creator__wallet_address=BENCH_CREATOR, name=BENCH_AGENT_NAME)
+        try:
+            return await run_load(make_request, total, concurrency)
+        finally:
+            self.created += [address async for address in agents.values_list('wallet_address', flat=True)]
+            await sync_to_async(agents.delete)()
@@ -0,0 +1,69 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.urls import reverse
+
+from agents.bench import asgi_request, run_load, summarize
+from break_agent.asgi import django_application
+
+
+def session_stats():
+    """Sessions opened against this database so far, and how many are connected now."""
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            'SELECT sessions, numbackends FROM pg_stat_database WHERE datname = current_database()'
+        )
+        sessions, backends = cursor.fetchone()
+    return sessions, backends
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends concurrent requests through the ASGI app and reports how many new '
+        'PostgreSQL sessions they opened (PostgreSQL 14+ only)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total number of requests to send')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Connection churn can only be measured on PostgreSQL')
+
+        options_dict = connection.settings_dict.get('OPTIONS', {})
+        if options_dict.get('pool'):
+            mode = f"pool (max_size={options_dict['pool'].get('max_size')})"
+        else:
+            mode = f"persistent (CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']})"
+        self.stdout.write(f'Connection mode: {mode}')
+
+        asyncio.run(self.run(options['requests'], options['concurrency']))
+
+    async def run(self, total, concurrency):
+        sessions_before, _ = await sync_to_async(session_stats)()
+
+        path = reverse('user_exists')
+
+        async def make_request():
+            status, _, body = await asgi_request(
+                django_application, 'GET', path, params={'wallet_address': 'bench'}
+            )
+            if status != 200:
+                raise CommandError(f'Request failed with {status}: {body[:200]!r}')
+
+        latencies, elapsed = await run_load(make_request, total, concurrency)
+
+        sessions_after, backends = await sync_to_async(session_stats)()
+        opened = sessions_after - sessions_before
+        summary = summarize(latencies, elapsed)
+
+        self.stdout.write(
+            f"{summary['requests']} requests in {elapsed * 1000:.0f} ms "
+            f"({summary['throughput_rps']:.0f} req/s, p50 {summary['p50_ms']:.1f} ms, "
+            f"p99 {summary['p99_ms']:.1f} ms)"
+        )
+        self.stdout.write(f'New database sessions opened: {opened} ({opened / total:.2f} per request)')
+        self.stdout.write(f'Sessions connected now: {backends}')
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agents.partitions import create_partitions, default_partition_rows, hash_buckets, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly chat message partitions (PostgreSQL only) through '
+        'CHAT_PARTITION_MONTHS_AHEAD months from now. Safe to run repeatedly, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.CHAT_PARTITION_MONTHS_AHEAD,
+                            help='Months after this one to create partitions for')
+        parser.add_argument('--from', dest='start', help='First month to create, as YYYY-MM (default: this month)')
+        parser.add_argument('--buckets', type=int, default=settings.CHAT_PARTITION_HASH_BUCKETS,
+                            help='Hash partitions by agent for each new month')
+        parser.add_argument('--change-buckets', action='store_true',
+                            help='Allow new months to use a different bucket count than the latest existing month')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('The chat message table is not partitioned (PostgreSQL only)')
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--from must be a month as YYYY-MM')
+
+        existing = hash_buckets()
+        if existing:
+            latest, latest_buckets = max(existing.items())
+            if latest_buckets != options['buckets'] and not options['change_buckets']:
+                raise CommandError(
+                    f'{latest} has {latest_buckets} hash partitions but {options["buckets"]} are configured '
+                    f'(CHAT_PARTITION_HASH_BUCKETS or --buckets). Set it to {latest_buckets}, or pass '
+                    f'--change-buckets to use {options["buckets"]} for new months.'
+                )
+
+        created = create_partitions(options['months_ahead'], start=start, buckets=options['buckets'])
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created'))
+
+        stranded = default_partition_rows()
+        if stranded:
+            self.stdout.write(self.style.WARNING(
+                f'{stranded} messages are in the default partition; create partitions for their '
+                f'months with --from'
+            ))
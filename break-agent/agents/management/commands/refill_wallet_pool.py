@@ -0,0 +1,32 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agents.models import PooledWallet
+from agents.wallet_pool import refill, run_refiller
+
+
+class Command(BaseCommand):
+    help = (
+        'Tops up the pool of pre-generated agent wallets. Run it from cron, or with '
+        '--loop as its own process; a run started while another is refilling does nothing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=settings.WALLET_POOL_SIZE,
+                            help='Number of wallets to keep in the pool')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep refilling every WALLET_POOL_REFILL_INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        if not settings.WALLET_POOL_ENCRYPTION_KEY:
+            raise CommandError('WALLET_POOL_ENCRYPTION_KEY must be set to use the wallet pool')
+        if options['loop']:
+            asyncio.run(run_refiller(size=options['size']))
+            return
+
+        created = refill(options['size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} wallets; {PooledWallet.objects.count()} in the pool'
+        ))
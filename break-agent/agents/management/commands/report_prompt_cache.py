@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from agents.models import ChatMessage
+
+
+class Command(BaseCommand):
+    help = 'Reports how much of each agent\'s prompt tokens were served from the provider prompt cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Only count completions from the last N days')
+        parser.add_argument('--limit', type=int, default=20, help='Number of agents to list, busiest first')
+
+    def handle(self, *args, **options):
+        completions = ChatMessage.objects.filter(
+            prompt_tokens__isnull=False,
+            created_at__gte=timezone.now() - timedelta(days=options['days'])
+        )
+        per_agent = (
+            completions
+            .values('conversation__agent__name', 'conversation__agent__wallet_address')
+            .annotate(requests=Count('id'), prompt=Sum('prompt_tokens'), cached=Sum('cached_tokens'))
+            .order_by('-prompt')[:options['limit']]
+        )
+
+        for row in per_agent:
+            self.stdout.write(
+                f"{row['conversation__agent__name']} ({row['conversation__agent__wallet_address']}): "
+                f"{row['requests']} requests, {row['cached']}/{row['prompt']} prompt tokens cached "
+                f"({self.rate(row['cached'], row['prompt'])})"
+            )
+
+        totals = completions.aggregate(requests=Count('id'), prompt=Sum('prompt_tokens'), cached=Sum('cached_tokens'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totals['requests']} requests, {totals['cached'] or 0}/{totals['prompt'] or 0} "
+            f"prompt tokens cached ({self.rate(totals['cached'], totals['prompt'])})"
+        ))
+
+    @staticmethod
+    def rate(cached, prompt):
+        return f'{(cached or 0) / prompt:.1%}' if prompt else 'n/a'
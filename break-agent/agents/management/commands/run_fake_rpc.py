@@ -0,0 +1,65 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agents.fake_rpc import FakeSolanaRPC
+from agents.models import Agent, PooledWallet
+from agents.solana import LAMPORTS_PER_SOL
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local fake Solana JSON-RPC node with an in-memory ledger, so the app can '
+        'run without network access. Point SOLANA_RPC_URL at it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8899)
+        parser.add_argument('--latency', type=float, default=settings.FAKE_SOLANA_RPC_LATENCY,
+                            help='Seconds each request takes')
+        parser.add_argument('--jitter', type=float, default=settings.FAKE_SOLANA_RPC_JITTER,
+                            help='Up to this many seconds added at random to each request')
+        parser.add_argument('--error-rate', type=float, default=settings.FAKE_SOLANA_RPC_ERROR_RATE,
+                            help='Fraction of requests answered with a 503')
+        parser.add_argument('--requests-per-second', type=float,
+                            default=settings.FAKE_SOLANA_RPC_REQUESTS_PER_SECOND,
+                            help='Requests per second before the rest get a 429 (0 = unlimited)')
+        parser.add_argument('--slot-time', type=float, default=settings.FAKE_SOLANA_RPC_SLOT_TIME,
+                            help='Seconds per block')
+        parser.add_argument('--fund', type=float, default=0,
+                            help='SOL to start every agent and pooled wallet with')
+
+    def handle(self, *args, **options):
+        balances = {}
+        if options['fund']:
+            addresses = list(Agent.objects.values_list('wallet_address', flat=True))
+            addresses += PooledWallet.objects.values_list('wallet_address', flat=True)
+            balances = dict.fromkeys(addresses, int(options['fund'] * LAMPORTS_PER_SOL))
+
+        fake_rpc = FakeSolanaRPC(
+            balances=balances,
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            requests_per_second=options['requests_per_second'],
+            slot_time=options['slot_time'],
+        )
+        try:
+            asyncio.run(self.run(fake_rpc))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            f'{fake_rpc.request_count} requests served, {fake_rpc.failed_count} failed, '
+            f'{fake_rpc.rate_limited_count} rate limited, {len(fake_rpc.transactions)} transactions'
+        )
+
+    async def run(self, fake_rpc):
+        await fake_rpc.start()
+        self.stdout.write(f'Fake Solana RPC listening on {fake_rpc.url}')
+        if fake_rpc.balances:
+            self.stdout.write(f'Funded {len(fake_rpc.balances)} wallets')
+        await fake_rpc.serve_forever()
@@ -0,0 +1,55 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agents import rpc
+from agents.balances import balance_cache_is_shared
+from agents.blockhash import blockhash_cache
+from agents.payouts import poll_sent_jobs, send_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Sends queued prize payouts and tracks them until they are confirmed on chain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PAYOUT_BATCH_SIZE,
+                            help='Maximum number of payouts to send concurrently')
+        parser.add_argument('--interval', type=float, default=settings.PAYOUT_POLL_INTERVAL,
+                            help='Seconds to wait between polls when there is nothing to send')
+        parser.add_argument('--once', action='store_true', help='Process one batch and exit')
+        parser.add_argument('--unshared-balance-cache', action='store_true',
+                            help="Run even though web workers won't see this process's balance "
+                                 "invalidations (they serve stale balances for up to BALANCE_CACHE_TTL)")
+
+    def handle(self, *args, **options):
+        # Sent payouts drop the wallets' cached balances, which only helps the
+        # web workers if they share the cache with this process
+        if not balance_cache_is_shared() and not options['unshared_balance_cache']:
+            raise CommandError(
+                "The balance cache isn't shared with the web workers, so they won't see payouts until "
+                "BALANCE_CACHE_TTL expires. Set BALANCE_CACHE_BACKEND='django' with a shared cache "
+                "(e.g. REDIS_URL), or pass --unshared-balance-cache."
+            )
+        asyncio.run(self.run(options['batch_size'], options['interval'], options['once']))
+
+    async def run(self, batch_size, interval, once):
+        # Keep a fresh blockhash around so sends don't wait on getLatestBlockhash
+        refresher = asyncio.ensure_future(blockhash_cache.run_refresher())
+        try:
+            while True:
+                claimed = await send_pending_jobs(batch_size)
+                try:
+                    await poll_sent_jobs()
+                except Exception as e:
+                    self.stderr.write(f'Error polling payout confirmations: {str(e)}')
+
+                if once:
+                    break
+                # Keep draining without sleeping while there's a backlog
+                if claimed < batch_size:
+                    await asyncio.sleep(interval)
+        finally:
+            refresher.cancel()
+            self.stdout.write(f'Blockhash cache: {blockhash_cache.stats()}')
+            await rpc.aclose()
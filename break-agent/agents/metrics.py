@@ -0,0 +1,276 @@
+"""
+Process metrics, served by the metrics view in the Prometheus text format.
+
+Counters and histograms are defined at module level and updated in place,
+e.g. `RPC_REQUESTS.inc(method='getBalance', outcome='ok')`. Stats that
+components already keep (the blockhash, prompt and catalogue caches, the
+LLM scheduler) are read when the endpoint is scraped, through collectors.
+
+With METRICS_ENABLED off (the default) every update returns straight away
+and /metrics/ is a 404. Each worker process keeps its own metrics, so scrape
+each worker or run a single one per target.
+"""
+import contextlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+
+# Upper bounds (seconds) of the latency histograms' buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_enabled = None
+_registry: List['Metric'] = []
+_collectors: List[Tuple[str, str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+
+
+def is_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        _enabled = settings.METRICS_ENABLED
+    return _enabled
+
+
+def _on_setting_changed(setting, **kwargs):
+    global _enabled
+    if setting == 'METRICS_ENABLED':
+        _enabled = None
+
+
+setting_changed.connect(_on_setting_changed)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple((name, str(labels.get(name, ''))) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not is_enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[Tuple[str, str], ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not is_enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes."""
+        if not is_enabled():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', key + (('le', _format_value(bound)),), cumulative))
+                samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', key, total))
+                samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+def collector(name: str, kind: str, help: str):
+    """
+    Register a function returning a value, or a {labels: value} dict, that is
+    read each time the metrics are scraped.
+    """
+    def register(func):
+        _collectors.append((name, kind, help, func))
+        return func
+    return register
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, kind, help, func in _collectors:
+        try:
+            value = func()
+        except Exception:
+            continue
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, sample in values.items():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(sample)}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_PHASE_SECONDS = Histogram(
+    'agents_request_phase_seconds', 'Time spent in each phase of a request', ('view', 'phase')
+)
+DB_QUERIES = Counter('agents_db_queries_total', 'Database queries executed')
+DB_QUERY_SECONDS = Histogram('agents_db_query_seconds', 'Database query latency')
+RPC_REQUESTS = Counter('agents_rpc_requests_total', 'Solana JSON-RPC calls', ('method', 'outcome'))
+RPC_SECONDS = Histogram('agents_rpc_seconds', 'Solana JSON-RPC call latency', ('method',))
+LLM_REQUESTS = Counter('agents_llm_requests_total', 'LLM completions', ('provider', 'outcome'))
+LLM_SECONDS = Histogram(
+    'agents_llm_seconds', 'LLM completion latency, including time queued in the scheduler', ('provider',)
+)
+LLM_TOKENS = Counter('agents_llm_tokens_total', 'LLM tokens used', ('kind',))
+CHAT_THROTTLED = Counter('agents_chat_throttled_total', 'Chat messages rejected by attempt limits', ('reason',))
+PAYOUTS = Counter('agents_payouts_total', 'Payout job outcomes', ('outcome',))
+
+
+def _count_query(execute, sql, params, many, context):
+    if not is_enabled():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start)
+        DB_QUERIES.inc()
+
+
+def _install_query_metrics(sender, connection, **kwargs):
+    if is_enabled() and _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_metrics)
+
+
+@collector('agents_blockhash_cache_lookups_total', 'counter', 'Blockhash cache lookups')
+def _blockhash_lookups():
+    from .blockhash import blockhash_cache
+
+    stats = blockhash_cache.stats()
+    return {(('result', 'hit'),): stats['hits'], (('result', 'miss'),): stats['misses']}
+
+
+@collector('agents_blockhash_refreshes_total', 'counter', 'getLatestBlockhash fetches')
+def _blockhash_refreshes():
+    from .blockhash import blockhash_cache
+
+    return blockhash_cache.stats()['refreshes']
+
+
+@collector('agents_blockhash_stale_rejections_total', 'counter', 'Sends rejected because the blockhash had expired')
+def _blockhash_stale_rejections():
+    from .blockhash import blockhash_cache
+
+    return blockhash_cache.stats()['stale_rejections']
+
+
+@collector('agents_prompt_cache_lookups_total', 'counter', 'Compiled prompt cache lookups')
+def _prompt_cache_lookups():
+    from .prompts import prompt_cache
+
+    stats = prompt_cache.stats()
+    return {(('result', 'hit'),): stats['hits'], (('result', 'miss'),): stats['misses']}
+
+
+@collector('agents_llm_scheduler_requests', 'gauge', 'LLM requests running and waiting in the scheduler')
+def _scheduler_requests():
+    from ._agent.scheduler import get_scheduler
+
+    stats = get_scheduler().stats()
+    return {(('state', 'running'),): stats['running'], (('state', 'queued'),): stats['queued']}
+
+
+@collector('agents_llm_scheduler_events_total', 'counter', 'LLM requests shed, retried and rate limited')
+def _scheduler_events():
+    from ._agent.scheduler import get_scheduler
+
+    stats = get_scheduler().stats()
+    return {(('event', event),): stats[event] for event in ('shed', 'retries', 'rate_limited')}
+
+
+@collector('agents_catalogue_agents', 'gauge', 'Active agents in the list_agents catalogue')
+def _catalogue_agents():
+    from .catalogue import catalogue
+
+    return catalogue.stats()['agents']
+
+
+@collector('agents_catalogue_page_lookups_total', 'counter', 'list_agents rendered page cache lookups')
+def _catalogue_page_lookups():
+    from .catalogue import catalogue
+
+    stats = catalogue.stats()
+    return {(('result', 'hit'),): stats['page_hits'], (('result', 'miss'),): stats['page_misses']}
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_alter_user_wallet_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient_wallet', models.CharField(max_length=44)),
+                ('amount', models.FloatField(default=-1.0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('confirmed', 'Confirmed'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('signature', models.CharField(blank=True, default='', max_length=88)),
+                ('last_valid_block_height', models.BigIntegerField(null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('confirmed_at', models.DateTimeField(null=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='agents.agent')),
+                ('chat_history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='payout', to='agents.chathistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='agents_payo_status_11109e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_payoutjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('role', models.CharField(max_length=16)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='agents.chathistory')),
+            ],
+            options={
+                'ordering': ['conversation', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'sequence'), name='unique_chat_message_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def copy_history_to_messages(apps, schema_editor):
+    ChatHistory = apps.get_model('agents', 'ChatHistory')
+    ChatMessage = apps.get_model('agents', 'ChatMessage')
+
+    for conversation in ChatHistory.objects.exclude(chat_history=[]).iterator(chunk_size=500):
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                conversation=conversation,
+                sequence=sequence,
+                role=message.get('role', 'user'),
+                content=message.get('content') or ''
+            )
+            for sequence, message in enumerate(conversation.chat_history)
+        ], batch_size=1000)
+        conversation.message_count = len(conversation.chat_history)
+        conversation.save(update_fields=['message_count'])
+
+
+def copy_messages_to_history(apps, schema_editor):
+    ChatHistory = apps.get_model('agents', 'ChatHistory')
+    ChatMessage = apps.get_model('agents', 'ChatMessage')
+
+    for conversation in ChatHistory.objects.iterator(chunk_size=500):
+        conversation.chat_history = [
+            {'role': role, 'content': content}
+            for role, content in ChatMessage.objects.filter(conversation=conversation)
+            .order_by('sequence').values_list('role', 'content')
+        ]
+        conversation.save(update_fields=['chat_history'])
+    ChatMessage.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_chatmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_history_to_messages, copy_messages_to_history),
+    ]
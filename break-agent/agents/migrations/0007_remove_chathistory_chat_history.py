@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_copy_chat_history_to_messages'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chathistory',
+            name='chat_history',
+        ),
+    ]
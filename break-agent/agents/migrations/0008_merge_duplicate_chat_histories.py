@@ -0,0 +1,76 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_payout_jobs(PayoutJob, kept, other):
+    """
+    Move `other`'s payout job to `kept` before `other` is deleted. A
+    conversation has at most one job, so if both have one the job that never
+    submitted a transaction (no signature) is dropped: both pay the same
+    agent's prize to the same user. If both did, neither can go.
+    """
+    other_job = PayoutJob.objects.filter(chat_history=other).first()
+    if other_job is None:
+        return
+    kept_job = PayoutJob.objects.filter(chat_history=kept).first()
+    if kept_job is not None:
+        if kept_job.signature and other_job.signature:
+            raise RuntimeError(
+                f'Conversations {kept.pk} and {other.pk} (agent {kept.agent_id}, user {kept.user_id}) '
+                f'both have submitted payouts (jobs {kept_job.pk} and {other_job.pk}); '
+                f'resolve them by hand before migrating'
+            )
+        if not other_job.signature:
+            other_job.delete()
+            return
+        kept_job.delete()
+    other_job.chat_history = kept
+    other_job.save(update_fields=['chat_history'])
+
+
+def merge_duplicate_chat_histories(apps, schema_editor):
+    """
+    Merge conversations that raced into existence for the same (agent, user)
+    so the unique constraint in 0009 can be added. The oldest conversation is
+    kept; later ones have their messages (minus their system prompt) appended
+    to it in order.
+    """
+    ChatHistory = apps.get_model('agents', 'ChatHistory')
+    ChatMessage = apps.get_model('agents', 'ChatMessage')
+    PayoutJob = apps.get_model('agents', 'PayoutJob')
+
+    duplicates = (
+        ChatHistory.objects.values('agent_id', 'user_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        conversations = list(
+            ChatHistory.objects.filter(agent_id=duplicate['agent_id'], user_id=duplicate['user_id'])
+            .order_by('started_at', 'id')
+        )
+        kept, others = conversations[0], conversations[1:]
+
+        for other in others:
+            for message in ChatMessage.objects.filter(conversation=other, sequence__gt=0).order_by('sequence'):
+                message.conversation = kept
+                message.sequence = kept.message_count
+                message.save(update_fields=['conversation', 'sequence'])
+                kept.message_count += 1
+
+            kept.triggered_secret_task = kept.triggered_secret_task or other.triggered_secret_task
+            merge_payout_jobs(PayoutJob, kept, other)
+            other.delete()
+
+        kept.save(update_fields=['message_count', 'triggered_secret_task'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0007_remove_chathistory_chat_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_chat_histories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0008_merge_duplicate_chat_histories'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agent',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='agent',
+            name='wallet_address',
+            field=models.CharField(max_length=44, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chathistory',
+            constraint=models.UniqueConstraint(fields=('agent', 'user'), name='unique_chat_history_agent_user'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0009_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['created_at', 'id'], name='agents_agen_created_54ba5b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['expires_at', 'id'], name='agents_agen_expires_700f7a_idx'),
+        ),
+    ]
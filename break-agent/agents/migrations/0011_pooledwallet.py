@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0010_agent_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledWallet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wallet_address', models.CharField(max_length=44, unique=True)),
+                ('encrypted_private_key', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
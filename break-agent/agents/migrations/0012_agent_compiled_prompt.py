@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0011_pooledwallet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='system_prompt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='secret_task_schema',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='prompt_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0013_compile_agent_prompts'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chathistory',
+            name='secret_task_schema',
+        ),
+    ]
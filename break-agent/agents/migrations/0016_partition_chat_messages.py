@@ -0,0 +1,176 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:37
+
+import django.db.models.deletion
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+TABLE = 'agents_chatmessage'
+
+# The partition layout this migration creates, frozen here rather than read from
+# settings or agents.partitions. Months created later by create_chat_partitions
+# follow CHAT_PARTITION_HASH_BUCKETS, which should match hash_buckets.
+INITIAL_PARTITION_LAYOUT = {
+    # Hash partitions by agent in each month partition
+    'hash_buckets': 8,
+    # Months after the current one to create partitions for
+    'months_ahead': 2,
+}
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_month_partition(cursor, month, buckets):
+    name = f'{TABLE}_y{month.year}m{month.month:02d}'
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+    next_month = add_months(month, 1)
+    end = datetime(next_month.year, next_month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}') PARTITION BY HASH (agent_id)"
+    )
+    for remainder in range(buckets):
+        cursor.execute(
+            f'CREATE TABLE {name}_p{remainder} PARTITION OF {name} '
+            f'FOR VALUES WITH (MODULUS {buckets}, REMAINDER {remainder})'
+        )
+
+
+def copy_conversation_keys(apps, schema_editor):
+    ChatHistory = apps.get_model('agents', 'ChatHistory')
+    ChatMessage = apps.get_model('agents', 'ChatMessage')
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # Check the new foreign keys now, or the ALTER TABLEs that follow fail on pending trigger events
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    conversations = ChatHistory.objects.filter(pk=OuterRef('conversation_id'))
+    ChatMessage.objects.update(
+        agent_id=Subquery(conversations.values('agent_id')[:1]),
+        conversation_started_at=Subquery(conversations.values('started_at')[:1]),
+    )
+
+
+def partition_chat_messages(apps, schema_editor):
+    """Rebuild agents_chatmessage as a partitioned table, copying the messages over."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ChatHistory = apps.get_model('agents', 'ChatHistory')
+    old = f'{TABLE}_unpartitioned'
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (conversation_started_at)'
+        )
+
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+        first = ChatHistory.objects.order_by('started_at').values_list('started_at', flat=True).first()
+        this_month = month_start(timezone.now())
+        month = month_start(first) if first else this_month
+        while month <= add_months(this_month, INITIAL_PARTITION_LAYOUT['months_ahead']):
+            create_month_partition(cursor, month, INITIAL_PARTITION_LAYOUT['hash_buckets'])
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        cursor.execute(f'DROP TABLE {old}')
+
+        # Identity columns can't be used on partitioned tables before PostgreSQL 17
+        cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+        cursor.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+        # Unique constraints on a partitioned table must include the partition keys
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey '
+            f'PRIMARY KEY (id, conversation_started_at, agent_id)'
+        )
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT unique_chat_message_sequence '
+            f'UNIQUE (conversation_id, sequence, conversation_started_at, agent_id)'
+        )
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_conversation_id_fk_agents_chathistory_id '
+            f'FOREIGN KEY (conversation_id) REFERENCES agents_chathistory (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_agent_id_fk_agents_agent_id '
+            f'FOREIGN KEY (agent_id) REFERENCES agents_agent (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+def unpartition_chat_messages(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    partitioned = f'{TABLE}_partitioned'
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {partitioned}')
+        cursor.execute(f'ALTER TABLE {partitioned} RENAME CONSTRAINT {TABLE}_pkey TO {partitioned}_pkey')
+        cursor.execute(
+            f'ALTER TABLE {partitioned} RENAME CONSTRAINT unique_chat_message_sequence '
+            f'TO {partitioned}_unique_sequence'
+        )
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {partitioned} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {partitioned}')
+        cursor.execute(f'DROP TABLE {partitioned}')
+        cursor.execute(f'SELECT COALESCE(max(id), 0) + 1 FROM {TABLE}')
+        restart = cursor.fetchone()[0]
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (RESTART {restart})'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT unique_chat_message_sequence UNIQUE (conversation_id, sequence)'
+        )
+        cursor.execute(f'CREATE INDEX {TABLE}_conversation_id ON {TABLE} (conversation_id)')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_conversation_id_fk_agents_chathistory_id '
+            f'FOREIGN KEY (conversation_id) REFERENCES agents_chathistory (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_agent_id_fk_agents_agent_id '
+            f'FOREIGN KEY (agent_id) REFERENCES agents_agent (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0015_chatmessage_token_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='agent',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='agents.agent'),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation_started_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_conversation_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='agent',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='agents.agent'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='conversation_started_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.RunPython(partition_chat_messages, unpartition_chat_messages),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class User(models.Model):
@@ -12,22 +13,133 @@ class Agent(models.Model):
     lore = models.JSONField(default=dict)
     behavior = models.JSONField(default=dict)
     secret_task = models.JSONField(default=dict)
-    wallet_address = models.CharField(max_length=44)  # Solana wallet address
+    wallet_address = models.CharField(max_length=44, unique=True)  # Solana wallet address
     private_key = models.CharField(max_length=128)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField(null=True)
+    expires_at = models.DateTimeField(null=True, db_index=True)
+
+    # Compiled from the fields above on every save (see agents/prompts.py)
+    system_prompt = models.TextField(blank=True, default='')
+    secret_task_schema = models.JSONField(default=dict)
+    prompt_hash = models.CharField(max_length=40, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the agent list
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['expires_at', 'id']),
+        ]
     
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        from .prompts import compile_prompt
+
+        compile_prompt(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'system_prompt', 'secret_task_schema', 'prompt_hash'}
+        super().save(*args, **kwargs)
+
 class ChatHistory(models.Model):
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages')
     
-    chat_history = models.JSONField(default=list)
-    secret_task_schema = models.JSONField(default=dict)
     started_at = models.DateTimeField(auto_now_add=True)
     triggered_secret_task = models.BooleanField(default=False)
+    # Sequence number the next ChatMessage gets
+    message_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['started_at']
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'user'], name='unique_chat_history_agent_user'),
+        ]
+
+class ChatMessage(models.Model):
+    """
+    One user or assistant message of a conversation, in order of sequence.
+    The system prompt isn't stored per conversation; it comes from the agent.
+
+    On PostgreSQL the table is partitioned by conversation_started_at and
+    agent (see agents/partitions.py), both copied from the conversation, so
+    filtering on them as well reads a single partition.
+    """
+    conversation = models.ForeignKey(ChatHistory, on_delete=models.CASCADE, related_name='chat_messages')
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='chat_messages', db_index=False)
+    conversation_started_at = models.DateTimeField()
+    sequence = models.PositiveIntegerField()
+    role = models.CharField(max_length=16)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Token usage of the completion that produced an assistant message;
+    # cached_tokens is the part of the prompt served from the provider's cache
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['conversation', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'sequence'], name='unique_chat_message_sequence'),
+        ]
+
+class PayoutJob(models.Model):
+    """
+    A prize payout for a conversation whose secret task was completed.
+
+    Jobs are created by the chat view and processed by the run_payouts
+    management command, which sends the transfer and tracks it until it is
+    confirmed on chain.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    CONFIRMED = 'confirmed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (CONFIRMED, 'Confirmed'),
+        (FAILED, 'Failed'),
+    ]
+
+    chat_history = models.OneToOneField(ChatHistory, on_delete=models.CASCADE, related_name='payout')
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='payouts')
+    recipient_wallet = models.CharField(max_length=44)
+    amount = models.FloatField(default=-1.0)  # SOL; negative pays out the whole balance
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    signature = models.CharField(max_length=88, blank=True, default='')
+    last_valid_block_height = models.BigIntegerField(null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    confirmed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+
+class PooledWallet(models.Model):
+    """
+    A pre-generated wallet waiting to be assigned to a new agent.
+
+    The pool is topped up in the background (see agents/wallet_pool.py) and
+    create_agent claims a wallet from it instead of generating one inline.
+    The private key is stored encrypted.
+    """
+    wallet_address = models.CharField(max_length=44, unique=True)
+    encrypted_private_key = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.wallet_address
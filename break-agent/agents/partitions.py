@@ -0,0 +1,147 @@
+"""
+Partitioning of the chat message table (PostgreSQL only).
+
+agents_chatmessage is partitioned by RANGE on conversation_started_at, one
+partition per month, and each month is split by HASH on agent_id into
+CHAT_PARTITION_HASH_BUCKETS partitions. Every message of a conversation lands
+in the same leaf, so reading a conversation's tail with its agent and start
+time prunes to that one table, and a busy agent's messages stay in its own,
+smaller partitions and indexes rather than one table-wide index.
+
+Month partitions must exist before conversations start in them; run
+`manage.py create_chat_partitions` (e.g. daily) to keep
+CHAT_PARTITION_MONTHS_AHEAD months ready. Messages of a month that has no
+partition go to the default partition and are moved out when it is created.
+
+The primary key and the (conversation, sequence) unique constraint include
+the partition keys, as PostgreSQL requires. Both keys are fixed per
+conversation, so the constraints mean the same as without them.
+"""
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+
+TABLE = 'agents_chatmessage'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def _bound(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc).isoformat()
+
+
+def is_partitioned(using: str = 'default') -> bool:
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def create_default_partition(cursor) -> None:
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+
+def create_month_partition(cursor, month: date, buckets: int) -> bool:
+    """
+    Create the partition for `month` and its hash partitions, moving any of
+    its rows out of the default partition. Returns False if it already exists.
+    """
+    name = partition_name(month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    start, end = _bound(month), _bound(add_months(month, 1))
+    # A new partition can't be attached while the default one holds rows in its
+    # range, so take the default out, attach, move the rows over and put it back
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} '
+        f'WHERE conversation_started_at >= %s AND conversation_started_at < %s)',
+        [start, end]
+    )
+    stranded = cursor.fetchone()[0]
+    if stranded:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}') PARTITION BY HASH (agent_id)"
+    )
+    for remainder in range(buckets):
+        cursor.execute(
+            f'CREATE TABLE {name}_p{remainder} PARTITION OF {name} '
+            f'FOR VALUES WITH (MODULUS {buckets}, REMAINDER {remainder})'
+        )
+
+    if stranded:
+        where = 'WHERE conversation_started_at >= %s AND conversation_started_at < %s'
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} {where}', [start, end])
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} {where}', [start, end])
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return True
+
+
+def create_partitions(months_ahead: int = None, start: Optional[date] = None, buckets: int = None,
+                      using: str = 'default') -> List[str]:
+    """
+    Create the month partitions from `start` (this month by default) through
+    `months_ahead` months after this month, or just `start`'s month if that is
+    later. Returns the names of those created.
+
+    The hash bucket count only applies to new months; existing ones keep theirs.
+    """
+    months_ahead = settings.CHAT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    buckets = buckets or settings.CHAT_PARTITION_HASH_BUCKETS
+    this_month = month_start(datetime.now(timezone.utc))
+    month = start or this_month
+    last = max(add_months(this_month, months_ahead), month)
+
+    created = []
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        create_default_partition(cursor)
+        while month <= last:
+            if create_month_partition(cursor, month, buckets):
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+
+def hash_buckets(using: str = 'default') -> Dict[str, int]:
+    """The number of hash partitions of each month partition, by name."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT month.relname, count(bucket.inhrelid)
+            FROM pg_inherits AS months
+            JOIN pg_class AS month ON month.oid = months.inhrelid
+            LEFT JOIN pg_inherits AS bucket ON bucket.inhparent = months.inhrelid
+            WHERE months.inhparent = %s::regclass AND month.relname <> %s
+            GROUP BY month.relname
+            ORDER BY month.relname
+            """,
+            [TABLE, DEFAULT_PARTITION]
+        )
+        return dict(cursor.fetchall())
+
+
+def default_partition_rows(using: str = 'default') -> int:
+    """Messages in the default partition, i.e. of months that had no partition yet."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {DEFAULT_PARTITION}')
+        return cursor.fetchone()[0]
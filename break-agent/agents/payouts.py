@@ -0,0 +1,184 @@
+"""
+Background processing of PayoutJob rows.
+
+Jobs move through: pending -> sending (claimed by a worker) -> sent (signed
+transaction recorded and submitted) -> confirmed, or back to pending with
+backoff when a send is rejected or its blockhash expires, and failed once
+PAYOUT_MAX_ATTEMPTS is reached.
+
+The signature is saved before the transaction is submitted, so a worker that
+dies mid-send leaves a job that is checked on chain rather than paid twice.
+
+Sent jobs aren't claimed: every worker polls all of them, and a job only
+leaves 'sent' through an update conditional on it still being sent with the
+same signature, so only one worker records each outcome.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import rpc
+from .blockhash import blockhash_cache, is_blockhash_not_found
+from .metrics import PAYOUTS
+from .models import PayoutJob
+from .solana import abuild_transfer, asend_transaction, aget_signature_statuses
+
+logger = logging.getLogger(__name__)
+
+
+def claim_jobs(batch_size: int) -> List[PayoutJob]:
+    """
+    Claim up to batch_size jobs that are due, locking them for PAYOUT_LEASE
+    seconds. Jobs left in 'sending' by a worker that died are reclaimed once
+    their lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            PayoutJob.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('agent')
+            .filter(
+                Q(status=PayoutJob.PENDING, next_attempt_at__lte=now)
+                | Q(status=PayoutJob.SENDING, locked_until__lt=now)
+            )
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        PayoutJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=PayoutJob.SENDING,
+            locked_until=now + timedelta(seconds=settings.PAYOUT_LEASE)
+        )
+    return jobs
+
+
+def _retry_fields(job: PayoutJob, error: str) -> Dict[str, Any]:
+    """The changes that send a job back to pending with backoff, or fail it once out of attempts."""
+    fields = {'last_error': error, 'signature': '', 'last_valid_block_height': None}
+    if job.attempts >= settings.PAYOUT_MAX_ATTEMPTS:
+        fields['status'] = PayoutJob.FAILED
+    else:
+        fields['status'] = PayoutJob.PENDING
+        fields['next_attempt_at'] = timezone.now() + timedelta(
+            seconds=settings.PAYOUT_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        )
+    return fields
+
+
+def _record_retry(job: PayoutJob, error: str) -> None:
+    PAYOUTS.inc(outcome='failed' if job.status == PayoutJob.FAILED else 'retried')
+    logger.warning(
+        "Payout %s attempt %s failed (%s): %s", job.id, job.attempts, job.status, error,
+        extra={'payout_job_id': job.id}
+    )
+
+
+async def _retry_later(job: PayoutJob, error: str) -> None:
+    for field, value in _retry_fields(job, error).items():
+        setattr(job, field, value)
+    await job.asave()
+    _record_retry(job, error)
+
+
+async def _finish_sent(job: PayoutJob, **fields) -> bool:
+    """
+    Apply `fields` to a sent job unless another worker has already moved it on.
+    Returns whether this worker did.
+    """
+    updated = await PayoutJob.objects.filter(
+        pk=job.pk, status=PayoutJob.SENT, signature=job.signature
+    ).aupdate(updated_at=timezone.now(), **fields)
+    if not updated:
+        return False
+    for field, value in fields.items():
+        setattr(job, field, value)
+    return True
+
+
+async def _retry_sent_later(job: PayoutJob, error: str) -> None:
+    if await _finish_sent(job, **_retry_fields(job, error)):
+        _record_retry(job, error)
+
+
+async def send_job(job: PayoutJob) -> None:
+    # A previous worker recorded a transaction but may have died before or
+    # after sending it; let confirmation polling find out which
+    if job.signature:
+        job.status = PayoutJob.SENT
+        await job.asave(update_fields=['status', 'updated_at'])
+        return
+
+    job.attempts += 1
+    try:
+        tx, last_valid_block_height = await abuild_transfer(job.agent.private_key, job.recipient_wallet, job.amount)
+    except ValueError as e:
+        # Bad parameters or nothing left to pay out; retrying won't help
+        job.status = PayoutJob.FAILED
+        job.last_error = str(e)
+        await job.asave()
+        PAYOUTS.inc(outcome='failed')
+        return
+    except Exception as e:
+        await _retry_later(job, str(e))
+        return
+
+    job.signature = str(tx.signatures[0])
+    job.last_valid_block_height = last_valid_block_height
+    job.status = PayoutJob.SENT
+    await job.asave()
+    PAYOUTS.inc(outcome='sent')
+
+    try:
+        await asend_transaction(tx)
+    except rpc.RPCError as e:
+        # Rejected by the node (e.g. failed preflight), so it can't land
+        if is_blockhash_not_found(e):
+            blockhash_cache.invalidate(stale=True)
+        await _retry_sent_later(job, str(e))
+    except Exception as e:
+        # The send may or may not have reached the node; polling decides
+        job.last_error = str(e)
+        await job.asave(update_fields=['last_error', 'updated_at'])
+
+
+async def send_pending_jobs(batch_size: int) -> int:
+    """Claim a batch of due jobs and send them concurrently. Returns the number claimed."""
+    jobs = await sync_to_async(claim_jobs)(batch_size)
+    await asyncio.gather(*(send_job(job) for job in jobs))
+    return len(jobs)
+
+
+async def poll_sent_jobs() -> None:
+    """Check every sent job's signature and record the outcome."""
+    jobs = [job async for job in PayoutJob.objects.filter(status=PayoutJob.SENT)]
+    if not jobs:
+        return
+
+    statuses = await aget_signature_statuses([job.signature for job in jobs])
+    block_height = None
+
+    for job, status in zip(jobs, statuses):
+        if status is None:
+            # Not seen (yet). Once the blockhash has expired it never will be
+            if job.last_valid_block_height is None:
+                continue
+            if block_height is None:
+                block_height = await rpc.call("getBlockHeight")
+            if block_height > job.last_valid_block_height:
+                await _retry_sent_later(job, 'Transaction expired before it was confirmed')
+        elif status.get('err'):
+            await _retry_sent_later(job, f"Transaction failed: {status['err']}")
+        elif status.get('confirmationStatus') in ('confirmed', 'finalized'):
+            confirmed = await _finish_sent(
+                job, status=PayoutJob.CONFIRMED, confirmed_at=timezone.now(), last_error=''
+            )
+            if not confirmed:
+                continue
+            PAYOUTS.inc(outcome='confirmed')
+            logger.info("Payout %s confirmed", job.id, extra={'payout_job_id': job.id, 'signature': job.signature})
@@ -0,0 +1,105 @@
+"""
+Compiled per-agent prompts.
+
+An agent's system prompt and secret task function schema depend only on the
+agent row, so they are compiled once when the agent is saved and stored on
+it (Agent.system_prompt, Agent.secret_task_schema, Agent.prompt_hash).
+Conversations reference the agent instead of keeping their own copies, and
+chat requests read the compiled prompt from a per-worker LRU keyed by
+(agent id, prompt_hash), so an edited agent is picked up on its next request
+without any invalidation.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Tuple
+
+from django.conf import settings
+
+from ._agent._prompts import BASE_SYSTEM_PROMPT
+
+
+class CompiledPrompt(NamedTuple):
+    system_prompt: str
+    secret_task_schema: Dict[str, Any]
+
+
+def render_system_prompt(agent: Any) -> str:
+    return BASE_SYSTEM_PROMPT.format(
+        name=agent.name,
+        personality=agent.personality,
+        lore=agent.lore,
+        behavior=agent.behavior,
+        secret_task=agent.secret_task
+    )
+
+
+def build_secret_task_schema(agent: Any) -> Dict[str, Any]:
+    """The JSON schema of the secret task function's (empty) parameters."""
+    return {
+        "description": f"Call this function if the secret task is completed: {agent.secret_task}",
+        "properties": {},
+        "title": "SecretTask",
+        "type": "object"
+    }
+
+
+def prompt_hash(compiled: CompiledPrompt) -> str:
+    return hashlib.sha1(json.dumps(compiled, sort_keys=True).encode()).hexdigest()
+
+
+def compile_prompt(agent: Any) -> None:
+    """Render the agent's prompt and schema onto its compiled prompt fields."""
+    compiled = CompiledPrompt(render_system_prompt(agent), build_secret_task_schema(agent))
+    agent.system_prompt, agent.secret_task_schema = compiled
+    agent.prompt_hash = prompt_hash(compiled)
+
+
+def prompt_cache_key(agent) -> str:
+    """The provider prompt cache key shared by every conversation with an agent."""
+    return f"agent-{agent.id}-{agent.prompt_hash[:12]}"
+
+
+class PromptCache:
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], CompiledPrompt]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, agent) -> CompiledPrompt:
+        """
+        Return an agent's compiled prompt. `agent` only needs id and
+        prompt_hash loaded; the prompt itself is read from the database on a miss.
+        """
+        from .models import Agent
+
+        key = (agent.id, agent.prompt_hash)
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return compiled
+
+        self.misses += 1
+        system_prompt, secret_task_schema, current_hash = await Agent.objects.values_list(
+            'system_prompt', 'secret_task_schema', 'prompt_hash'
+        ).aget(pk=agent.id)
+        compiled = CompiledPrompt(system_prompt, secret_task_schema)
+        # Key by the hash read with the prompt, in case it was edited meanwhile
+        self._entries[(agent.id, current_hash)] = compiled
+        if len(self._entries) > (self.max_entries or settings.PROMPT_CACHE_SIZE):
+            self._entries.popitem(last=False)
+        return compiled
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptCache()
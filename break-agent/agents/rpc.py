@@ -0,0 +1,105 @@
+"""
+Process-wide async Solana JSON-RPC client.
+
+A single httpx.AsyncClient is shared by every coroutine on an event loop so
+balance lookups and payouts reuse pooled keep-alive (HTTP/2 when available)
+connections instead of opening a fresh TCP+TLS connection per call.
+
+httpx clients are bound to the event loop they were first used on. Under an
+ASGI server there is one loop per worker and therefore one client; under the
+sync dev server each request gets its own loop and its own short-lived client.
+"""
+import asyncio
+import itertools
+import time
+import weakref
+from typing import Any, List, Optional
+
+import httpx
+from django.conf import settings
+
+from .metrics import RPC_REQUESTS, RPC_SECONDS
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_request_ids = itertools.count(1)
+
+
+def _build_client() -> httpx.AsyncClient:
+    try:
+        import h2  # noqa: F401
+        http2 = settings.SOLANA_RPC_HTTP2
+    except ImportError:
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.SOLANA_RPC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SOLANA_RPC_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SOLANA_RPC_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.SOLANA_RPC_TIMEOUT,
+            connect=settings.SOLANA_RPC_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[loop] = client
+    return client
+
+
+async def aclose() -> None:
+    """Close the client bound to the running event loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def call(method: str, params: Optional[List[Any]] = None) -> Any:
+    """
+    Make a single JSON-RPC call against SOLANA_RPC_URL.
+
+    Returns:
+        The `result` member of the response
+
+    Raises:
+        RPCError: If the node returned a JSON-RPC error
+        httpx.HTTPError: On transport errors or non-2xx responses
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = await get_client().post(
+            settings.SOLANA_RPC_URL,
+            json={
+                "jsonrpc": "2.0",
+                "id": next(_request_ids),
+                "method": method,
+                "params": params or []
+            }
+        )
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            outcome = 'rpc_error'
+            raise RPCError(data['error'].get('code', 0), data['error'].get('message', ''))
+        outcome = 'ok'
+        return data['result']
+    finally:
+        RPC_SECONDS.observe(time.perf_counter() - start, method=method)
+        RPC_REQUESTS.inc(method=method, outcome=outcome)
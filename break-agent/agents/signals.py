@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogue import bump_generation
+from .models import Agent
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def agent_changed(sender, **kwargs):
+    # Listed agents changed; every worker's catalogue snapshot must be rebuilt,
+    # but only once the change is visible to the rebuild's query
+    transaction.on_commit(bump_generation)
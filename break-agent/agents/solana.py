@@ -1,21 +1,41 @@
+import base64
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from solders.hash import Hash
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey
 from solders.message import Message
 from solders.transaction import Transaction
 
+from django.conf import settings
 from solana.rpc.api import Client
+
+from . import rpc
+from .blockhash import blockhash_cache, is_blockhash_not_found
 from solders.system_program import TransferParams, transfer
 
+logger = logging.getLogger(__name__)
 
 LAMPORTS_PER_SOL = 1000000000
 RESIDUAL_SOL_AMOUNT = 0.000005
 
+def load_keypair(private_key: str) -> Keypair:
+    """
+    Load a keypair from either the hex encoding generate_wallet produces or a
+    base58 encoded secret key (as exported by wallets).
+    """
+    try:
+        return Keypair.from_bytes(bytes.fromhex(private_key))
+    except ValueError:
+        return Keypair.from_base58_string(private_key)
+
 def transfer_sol(from_private_key: str, to_address: str, amount: float):
     """
     Transfer SOL from one wallet to another on the Solana blockchain.
 
     Args:
-        from_private_key (str): Base58 encoded private key of the sender's wallet
+        from_private_key (str): Hex or base58 encoded private key of the sender's wallet
         to_address (str): Public key address of the recipient's wallet
         amount (float): Amount of SOL to transfer
 
@@ -24,49 +44,40 @@ def transfer_sol(from_private_key: str, to_address: str, amount: float):
               The result contains transaction signature and other details
 
     Note:
-        - Uses devnet for safety
+        - Uses SOLANA_RPC_URL (devnet by default) for safety
         - Amount is converted from SOL to lamports (1 SOL = 1 billion lamports)
         - Returns None if any required parameters are missing or if transaction fails
     """
     try:
         if not all([from_private_key, to_address, amount]):
-            print("Missing required parameters for transfer_sol")
+            logger.warning("Missing required parameters for transfer_sol")
             return None
 
-        # Initialize Solana client (using devnet for safety)
-        print("Initializing Solana client on devnet...")
-        client = Client("https://api.devnet.solana.com")
+        # Initialize Solana client (devnet unless SOLANA_RPC_URL says otherwise)
+        client = Client(settings.SOLANA_RPC_URL, timeout=settings.SOLANA_RPC_TIMEOUT)
 
         # Create sender keypair from private key
-        print(f"Creating sender keypair from private key...")
-        sender = Keypair.from_base58_string(from_private_key)
-        print(f"Sender public key: {sender.pubkey()}")
+        sender = load_keypair(from_private_key)
 
         # If amount is negative, transfer all available balance
         if amount < 0:
-            print("Negative amount specified - calculating maximum transfer amount...")
             balance_response = client.get_balance(sender.pubkey())
             if balance_response.value is None:
-                print("Failed to get sender balance")
+                logger.warning("Failed to get balance of %s", sender.pubkey())
                 return None
-            print(f"Current balance: {balance_response.value / LAMPORTS_PER_SOL} SOL")
             # Leave some SOL for transaction fees (0.000005 SOL)
             lamports = balance_response.value - RESIDUAL_SOL_AMOUNT * LAMPORTS_PER_SOL
             if lamports <= 0:
-                print("Insufficient balance for transfer")
+                logger.warning("Insufficient balance to transfer from %s", sender.pubkey())
                 return None
-            print(f"Transferring {lamports / LAMPORTS_PER_SOL} SOL (keeping {RESIDUAL_SOL_AMOUNT} SOL for fees)")
         else:
             # Convert SOL to lamports (1 SOL = 1 billion lamports)
             lamports = int(amount * LAMPORTS_PER_SOL)
-            print(f"Converting {amount} SOL to {lamports} lamports")
 
         # Create receiver public key
-        print(f"Creating receiver public key from address: {to_address}")
         receiver = Pubkey.from_string(to_address)
 
         # Create transfer instruction
-        print("Creating transfer instruction...")
         transfer_instruction = transfer(
             TransferParams(
                 from_pubkey=sender.pubkey(),
@@ -75,19 +86,22 @@ def transfer_sol(from_private_key: str, to_address: str, amount: float):
             )
         )
 
-        # Get recent blockhash
-        print("Getting recent blockhash...")
-        recent_blockhash = client.get_latest_blockhash().value.blockhash
+        # Get recent blockhash, reusing the shared cached one while it's fresh
+        cached = blockhash_cache.peek()
+        if cached is not None:
+            recent_blockhash = Hash.from_string(cached[0])
+        else:
+            latest = client.get_latest_blockhash().value
+            recent_blockhash = latest.blockhash
+            blockhash_cache.store(str(latest.blockhash), latest.last_valid_block_height)
 
         # Create message from instruction
-        print("Creating transaction message...")
         message = Message(
             instructions=[transfer_instruction],
             payer=sender.pubkey()
         )
 
         # Create and sign transaction
-        print("Creating and signing transaction...")
         transaction = Transaction(
             from_keypairs=[sender],
             message=message,
@@ -95,14 +109,153 @@ def transfer_sol(from_private_key: str, to_address: str, amount: float):
         )
 
         # Send transaction
-        print("Sending transaction...")
         result = client.send_transaction(transaction)
-        print(f"Transaction sent successfully: {result}")
+        logger.info(
+            "Sent %s SOL from %s to %s", lamports / LAMPORTS_PER_SOL, sender.pubkey(), to_address,
+            extra={'signature': str(result.value)}
+        )
+
+        # Both balances are about to change, so stop serving the cached ones
+        from .balances import invalidate_balances
+        invalidate_balances([str(sender.pubkey()), to_address])
 
         return result
 
-    except Exception as e:
-        print(f"Error in transfer_sol: {str(e)}")
+    except Exception:
+        logger.exception("Error in transfer_sol")
+        return None
+
+async def abuild_transfer(from_private_key: str, to_address: str, amount: float) -> Tuple[Transaction, int]:
+    """
+    Build and sign a transfer without sending it.
+
+    The signature (transaction.signatures[0]) is known before the transaction
+    is submitted, so callers can record it first and later check whether it
+    landed instead of blindly re-sending. The blockhash comes from the shared
+    blockhash_cache.
+
+    Returns:
+        tuple: (signed transaction, last block height at which its blockhash is valid)
+
+    Raises:
+        ValueError: If the parameters are missing or the balance is too low
+        agents.rpc.RPCError / httpx.HTTPError: If an RPC call fails
+    """
+    if not all([from_private_key, to_address, amount]):
+        raise ValueError("Missing required parameters for transfer")
+
+    sender = load_keypair(from_private_key)
+    receiver = Pubkey.from_string(to_address)
+
+    if amount < 0:
+        # Leave some SOL for transaction fees
+        balance = await rpc.call("getBalance", [str(sender.pubkey())])
+        lamports = int(balance['value'] - RESIDUAL_SOL_AMOUNT * LAMPORTS_PER_SOL)
+        if lamports <= 0:
+            raise ValueError("Insufficient balance for transfer")
+    else:
+        lamports = int(amount * LAMPORTS_PER_SOL)
+
+    transfer_instruction = transfer(
+        TransferParams(
+            from_pubkey=sender.pubkey(),
+            to_pubkey=receiver,
+            lamports=lamports
+        )
+    )
+
+    blockhash, last_valid_block_height = await blockhash_cache.get()
+    recent_blockhash = Hash.from_string(blockhash)
+
+    message = Message(
+        instructions=[transfer_instruction],
+        payer=sender.pubkey()
+    )
+    transaction = Transaction(
+        from_keypairs=[sender],
+        message=message,
+        recent_blockhash=recent_blockhash
+    )
+
+    return transaction, last_valid_block_height
+
+async def asend_transaction(transaction: Transaction) -> str:
+    """
+    Submit a signed transaction through the shared RPC client.
+
+    Returns:
+        str: Signature of the submitted transaction
+    """
+    from .balances import ainvalidate_balances
+
+    signature = await rpc.call(
+        "sendTransaction",
+        [base64.b64encode(bytes(transaction)).decode(), {"encoding": "base64"}]
+    )
+
+    # Balances of the accounts involved are about to change, so stop serving the cached ones
+    await ainvalidate_balances(str(key) for key in transaction.message.account_keys)
+
+    return signature
+
+async def asend_transfer(from_private_key: str, to_address: str, amount: float) -> str:
+    """
+    Async version of transfer_sol that runs on the shared RPC client (agents.rpc),
+    so a payout never blocks the event loop.
+
+    Args:
+        from_private_key (str): Hex or base58 encoded private key of the sender's wallet
+        to_address (str): Public key address of the recipient's wallet
+        amount (float): Amount of SOL to transfer; negative transfers the whole
+                        balance minus RESIDUAL_SOL_AMOUNT
+
+    Returns:
+        str: Signature of the submitted transaction
+
+    Raises:
+        ValueError: If the parameters are missing or the balance is too low
+        agents.rpc.RPCError / httpx.HTTPError: If an RPC call fails
+    """
+    transaction, _ = await abuild_transfer(from_private_key, to_address, amount)
+    try:
+        return await asend_transaction(transaction)
+    except rpc.RPCError as e:
+        if not is_blockhash_not_found(e):
+            raise
+        # The cached blockhash went stale; rebuild once with a fresh one
+        blockhash_cache.invalidate(stale=True)
+        transaction, _ = await abuild_transfer(from_private_key, to_address, amount)
+        return await asend_transaction(transaction)
+
+async def aget_signature_statuses(signatures: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Look up the status of submitted transactions, 256 signatures per RPC call.
+
+    Returns:
+        list: One entry per signature, None if the node has not seen it
+    """
+    statuses = []
+    for i in range(0, len(signatures), 256):
+        result = await rpc.call(
+            "getSignatureStatuses",
+            [signatures[i:i + 256], {"searchTransactionHistory": False}]
+        )
+        statuses.extend(result['value'])
+    return statuses
+
+async def atransfer_sol(from_private_key: str, to_address: str, amount: float) -> Optional[str]:
+    """
+    Non-blocking drop-in for transfer_sol in async views.
+
+    Returns:
+        str: Transaction signature if successful, None if failed
+    """
+    try:
+        signature = await asend_transfer(from_private_key, to_address, amount)
+        logger.info("Sent transfer from agent wallet to %s", to_address, extra={'signature': signature})
+        return signature
+    except Exception:
+        logger.exception("Error in atransfer_sol")
         return None
 
 def generate_wallet():
@@ -0,0 +1,70 @@
+import asyncio
+import contextlib
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from solders.keypair import Keypair
+
+from agents import balances, rpc
+from agents.balances import LocalBalanceCache, get_cached_balance, get_cached_balances
+from agents.blockhash import blockhash_cache
+from agents.fake_rpc import FakeSolanaRPC
+from agents.solana import LAMPORTS_PER_SOL, asend_transfer, generate_wallet
+
+
+@override_settings(BALANCE_CACHE_TTL=60)
+class BalanceCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.wallet, self.private_key = generate_wallet()
+        self.recipient = str(Keypair().pubkey())
+        # Start every test with an empty cache
+        patcher = mock.patch.object(balances, '_balance_cache', LocalBalanceCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @contextlib.asynccontextmanager
+    async def chain(self, latency=0.0):
+        """A fake RPC node holding 1 SOL in self.wallet, that the app talks to."""
+        fake_rpc = FakeSolanaRPC(balances={self.wallet: LAMPORTS_PER_SOL}, latency=latency, slot_time=0.01)
+        await fake_rpc.start()
+        blockhash_cache.invalidate()
+        try:
+            with override_settings(SOLANA_RPC_URL=fake_rpc.url):
+                yield fake_rpc
+        finally:
+            await rpc.aclose()
+            await fake_rpc.stop()
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        async with self.chain(latency=0.05) as fake_rpc:
+            results = await asyncio.gather(*(get_cached_balance(self.wallet) for _ in range(20)))
+            self.assertEqual(results, [1.0] * 20)
+            self.assertEqual(fake_rpc.method_counts['getMultipleAccounts'], 1)
+
+            # and later lookups are served from the cache
+            self.assertEqual(await get_cached_balances([self.wallet, self.wallet]), {self.wallet: 1.0})
+            self.assertEqual(fake_rpc.method_counts['getMultipleAccounts'], 1)
+
+    async def test_entries_expire_after_the_ttl(self):
+        async with self.chain() as fake_rpc:
+            with override_settings(BALANCE_CACHE_TTL=0.05):
+                self.assertEqual(await get_cached_balance(self.wallet), 1.0)
+            fake_rpc.balances[self.wallet] = 2 * LAMPORTS_PER_SOL
+            self.assertEqual(await get_cached_balance(self.wallet), 1.0)
+
+            await asyncio.sleep(0.06)
+            self.assertEqual(await get_cached_balance(self.wallet), 2.0)
+            self.assertEqual(fake_rpc.method_counts['getMultipleAccounts'], 2)
+
+    async def test_transfer_invalidates_both_wallets(self):
+        async with self.chain() as fake_rpc:
+            self.assertEqual(await get_cached_balances([self.wallet, self.recipient]), {
+                self.wallet: 1.0, self.recipient: 0.0
+            })
+            await asend_transfer(self.private_key, self.recipient, 0.25)
+
+            after = await get_cached_balances([self.wallet, self.recipient])
+            self.assertEqual(fake_rpc.method_counts['getMultipleAccounts'], 2)
+            self.assertEqual(after[self.recipient], 0.25)
+            self.assertLessEqual(after[self.wallet], 0.75)
+            self.assertEqual(after[self.wallet], fake_rpc.balances[self.wallet] / LAMPORTS_PER_SOL)
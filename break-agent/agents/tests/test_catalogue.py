@@ -0,0 +1,170 @@
+from datetime import timedelta
+from itertools import count
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from agents import catalogue as catalogue_module
+from agents.catalogue import Catalogue, catalogue, encode_cursor
+from agents.models import Agent, User
+
+wallets = count()
+
+
+class CatalogueTestCase(TestCase):
+    def setUp(self):
+        self.prize_pools = {}
+
+        async def get_cached_balances(addresses):
+            return {address: self.prize_pools.get(address, 0.0) for address in addresses}
+
+        patcher = mock.patch.object(catalogue_module, 'get_cached_balances', get_cached_balances)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.creator = User.objects.create(wallet_address='creator')
+
+    def create_agent(self, prize_pool=0.0, **fields):
+        wallet_address = f'wallet{next(wallets)}'
+        self.prize_pools[wallet_address] = prize_pool
+        return Agent.objects.create(
+            creator=self.creator, name=wallet_address, wallet_address=wallet_address, private_key='key',
+            expires_at=fields.pop('expires_at', timezone.now() + timedelta(days=1)), **fields
+        )
+
+
+class CataloguePageTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.agents = [self.create_agent(prize_pool=i % 3) for i in range(7)]
+        self.catalogue = Catalogue()
+        async_to_sync(self.catalogue.rebuild)()
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            page = self.catalogue.page({**params, 'limit': '3', 'cursor': cursor})
+            self.assertLessEqual(len(page['agents']), 3)
+            ids += [agent['id'] for agent in page['agents']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_every_agent_once_in_order(self):
+        self.assertEqual(self.pages(), [agent.id for agent in self.agents])
+        self.assertEqual(self.pages(sort='-created_at'), [agent.id for agent in reversed(self.agents)])
+
+    def test_prize_pool_ties_are_ordered_by_id(self):
+        expected = [agent.id for agent in sorted(self.agents, key=lambda a: (self.prize_pools[a.wallet_address], a.id))]
+        self.assertEqual(self.pages(sort='prize_pool'), expected)
+        self.assertEqual(self.pages(sort='-prize_pool'), expected[::-1])
+
+    def test_new_agents_do_not_shift_later_pages(self):
+        first = self.catalogue.page({'sort': '-created_at', 'limit': '3'})
+        self.create_agent()
+        async_to_sync(self.catalogue.rebuild)()
+        second = self.catalogue.page({'sort': '-created_at', 'limit': '3', 'cursor': first['next_cursor']})
+        self.assertEqual([agent['id'] for agent in second['agents']], [agent.id for agent in self.agents[3:0:-1]])
+
+    def test_cursor_must_match_the_sort(self):
+        cursor = encode_cursor('created_at', self.agents[0].created_at, self.agents[0].id)
+        with self.assertRaisesMessage(ValueError, 'different sort order'):
+            self.catalogue.page({'sort': 'expires_at', 'cursor': cursor})
+        with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+            self.catalogue.page({'cursor': 'not a cursor'})
+
+    def test_detail_fields_only_when_requested(self):
+        agent = self.catalogue.page({'limit': '1'})['agents'][0]
+        self.assertNotIn('lore', agent)
+        agent = self.catalogue.page({'limit': '1', 'fields': 'lore'})['agents'][0]
+        self.assertIn('lore', agent)
+        self.assertNotIn('personality', agent)
+
+    def test_expired_agents_are_not_listed(self):
+        self.create_agent(expires_at=timezone.now() - timedelta(seconds=1))
+        async_to_sync(self.catalogue.rebuild)()
+        self.assertEqual(self.pages(), [agent.id for agent in self.agents])
+
+
+class ListAgentsConditionalTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_agent(prize_pool=1.0)
+        catalogue.invalidate()
+        self.url = reverse('list_agents')
+
+    def test_unchanged_catalogue_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_new_agent_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_agent()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_prize_pool_change_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.prize_pools = {address: balance + 1 for address, balance in self.prize_pools.items()}
+        async_to_sync(catalogue.refresh_prize_pools)()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_same_snapshot_has_the_same_etag_in_every_worker(self):
+        etag = self.client.get(self.url)['ETag']
+        other_worker = Catalogue()
+        async_to_sync(other_worker.rebuild)()
+        self.assertEqual(other_worker.etag, etag)
+
+
+@override_settings(CATALOGUE_REFRESH_INTERVAL=0)
+class UnsharedCacheTests(CatalogueTestCase):
+    """Workers without a shared cache, e.g. no REDIS_URL: each has its own LocMemCache."""
+
+    def setUp(self):
+        super().setUp()
+        self.create_agent()
+        self.workers = []
+        for name in ('a', 'b'):
+            worker_cache = LocMemCache(f'catalogue-tests-{name}', {})
+            worker_cache.clear()
+            worker = Catalogue()
+            with self.on(worker_cache):
+                async_to_sync(worker.ensure)()
+            self.workers.append((worker, worker_cache))
+
+    def on(self, worker_cache):
+        return mock.patch.object(catalogue_module, 'cache', worker_cache)
+
+    def listed(self, worker, worker_cache):
+        with self.on(worker_cache):
+            async_to_sync(worker.ensure)()
+        return [agent['id'] for agent in worker.page({})['agents']]
+
+    def test_agent_created_on_one_worker_is_listed_by_another(self):
+        (_, cache_a), (b, cache_b) = self.workers
+        with self.on(cache_a), self.captureOnCommitCallbacks(execute=True):
+            agent = self.create_agent()
+        # Worker b never sees worker a's generation bump
+        self.assertIsNone(cache_b.get(catalogue_module.GENERATION_CACHE_KEY))
+        self.assertIn(agent.id, self.listed(b, cache_b))
+
+    def test_agent_deleted_on_one_worker_is_dropped_by_another(self):
+        (_, cache_a), (b, cache_b) = self.workers
+        agent = Agent.objects.get()
+        self.assertEqual(self.listed(b, cache_b), [agent.id])
+        with self.on(cache_a), self.captureOnCommitCallbacks(execute=True):
+            agent.delete()
+        self.assertEqual(self.listed(b, cache_b), [])
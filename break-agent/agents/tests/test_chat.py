@@ -0,0 +1,71 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from agents._agent import chat
+from agents._agent.chat import fit_history
+
+
+def words(text):
+    return len(text.split())
+
+
+def message(role, size, n=0):
+    return {"role": role, "content": " ".join([f"word{n}"] * size)}
+
+
+def conversation(turns, size=10):
+    history = [message("system", 20)]
+    for i in range(turns):
+        history.append(message("user" if i % 2 == 0 else "assistant", size, i))
+    return history
+
+
+# One token per word, so costs don't depend on whether tiktoken is available.
+# A message of n words costs 3 (framing) + 1 (role) + n tokens.
+@mock.patch.object(chat, 'count_text_tokens', words)
+class FitHistoryTests(SimpleTestCase):
+    def test_history_that_fits_is_kept(self):
+        history = conversation(5)
+        messages, tokens = fit_history(history, max_tokens=1000)
+        self.assertEqual(messages, history)
+        self.assertEqual(tokens["dropped_messages"], 0)
+        self.assertEqual(tokens["prompt_tokens"], tokens["history_tokens"])
+
+    def test_oldest_turns_are_dropped_first(self):
+        history = conversation(9)
+        # System (24 + 3 priming) plus the last five 14-token messages
+        messages, tokens = fit_history(history, max_tokens=27 + 5 * 14)
+        self.assertEqual(messages, history[:1] + history[-5:])
+        self.assertEqual(tokens["dropped_messages"], 4)
+        self.assertEqual(tokens["prompt_tokens"], 27 + 5 * 14)
+
+    def test_reserved_tokens_count_against_the_budget(self):
+        history = conversation(9)
+        messages, tokens = fit_history(history, max_tokens=27 + 5 * 14, reserved_tokens=2 * 14)
+        self.assertEqual(messages, history[:1] + history[-3:])
+        self.assertEqual(tokens["prompt_tokens"], 27 + 5 * 14)
+
+    def test_system_prompt_and_latest_message_are_always_kept(self):
+        history = conversation(3, size=100)
+        messages, tokens = fit_history(history, max_tokens=10)
+        self.assertEqual(messages, [history[0], history[-1]])
+        self.assertEqual(tokens["dropped_messages"], 2)
+
+    def test_window_does_not_start_with_an_assistant_message(self):
+        history = conversation(8)
+        messages, _ = fit_history(history, max_tokens=27 + 5 * 14)
+        # The last five would fit, but they start with a reply
+        self.assertEqual(messages, history[:1] + history[-4:])
+
+    def test_blocks_keep_the_window_start_until_a_whole_block_is_dropped(self):
+        budget = 27 + 6 * 14
+        starts = []
+        for turns in range(6, 12):
+            history = conversation(turns)
+            messages, _ = fit_history(history, max_tokens=budget, block_size=4)
+            starts.append(history.index(messages[1]))
+            self.assertLessEqual(chat.count_tokens(messages), budget)
+        # Dropping 4 messages at a time moves the start twice over six turns,
+        # where dropping one at a time would move it on every turn
+        self.assertEqual(starts, [1, 5, 5, 5, 5, 9])
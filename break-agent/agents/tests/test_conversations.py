@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import TransactionTestCase
+
+from agents.conversations import append_messages
+from agents.models import Agent, ChatHistory, ChatMessage, User
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite serializes writers by locking the whole database')
+class AppendMessagesTests(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create(wallet_address='user')
+        agent = Agent.objects.create(creator=user, name='agent', wallet_address='agent', private_key='key')
+        self.conversation = ChatHistory.objects.create(agent=agent, user=user)
+
+    def test_concurrent_appends_get_distinct_contiguous_sequences(self):
+        turns = 20
+
+        def append_turn(i):
+            try:
+                # Each thread has a stale copy, as concurrent requests would
+                conversation = ChatHistory.objects.get(pk=self.conversation.pk)
+                append_messages(conversation, [
+                    {'role': 'user', 'content': f'question {i}'},
+                    {'role': 'assistant', 'content': f'answer {i}'},
+                ])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(append_turn, range(turns)))
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 2 * turns)
+        rows = list(ChatMessage.objects.filter(conversation=self.conversation)
+                    .order_by('sequence').values_list('sequence', 'role', 'content'))
+        self.assertEqual([sequence for sequence, _, _ in rows], list(range(2 * turns)))
+        # A turn's two messages are next to each other
+        for (_, role, question), (_, _, answer) in zip(rows[::2], rows[1::2]):
+            self.assertEqual(role, 'user')
+            self.assertEqual(answer, question.replace('question', 'answer'))
@@ -0,0 +1,53 @@
+import logging
+
+from django.test import SimpleTestCase
+from solders.keypair import Keypair
+from solders.signature import Signature
+
+from agents.log import _PRIVATE_KEY, REDACTED, RedactFilter
+
+
+def redacted(msg, *args, **extra):
+    """A record logged with msg % args and `extra`, after the RedactFilter."""
+    record = logging.LogRecord('agents', logging.INFO, __file__, 0, msg, args or None, None)
+    record.__dict__.update(extra)
+    RedactFilter().filter(record)
+    return record
+
+
+class RedactFilterTests(SimpleTestCase):
+    def setUp(self):
+        keypair = Keypair()
+        self.hex_key = bytes(keypair).hex()
+        self.base58_key = str(keypair)
+        # 64 bytes shaped like a keypair, but whose public half isn't derived
+        # from the secret half: the same length and alphabet as a key
+        not_a_keypair = bytes(keypair)[:32] + bytes(Keypair().pubkey())
+        self.hex_lookalike = not_a_keypair.hex()
+        self.base58_lookalike = str(Signature(not_a_keypair))
+
+    def test_keys_in_the_message_are_masked(self):
+        for key in (self.hex_key, self.base58_key):
+            with self.subTest(key=key):
+                record = redacted(f'imported wallet {key} for agent 7')
+                self.assertEqual(record.getMessage(), f'imported wallet {REDACTED} for agent 7')
+
+    def test_keys_in_the_arguments_are_masked(self):
+        for key in (self.hex_key, self.base58_key):
+            with self.subTest(key=key):
+                record = redacted('imported wallet %s for agent %d', key, 7)
+                self.assertEqual(record.getMessage(), f'imported wallet {REDACTED} for agent 7')
+                self.assertIsNone(record.args)
+
+    def test_keys_in_extra_fields_are_masked(self):
+        record = redacted('payout failed', error=f'bad key {self.base58_key}', private_key='anything')
+        self.assertEqual(record.error, f'bad key {REDACTED}')
+        self.assertEqual(record.private_key, REDACTED)
+
+    def test_lookalikes_matching_the_key_pattern_are_left_alone(self):
+        for text in (self.hex_lookalike, self.base58_lookalike):
+            with self.subTest(text=text):
+                self.assertRegex(text, _PRIVATE_KEY)
+                record = redacted('sent transaction %s', text, signature=text)
+                self.assertEqual(record.getMessage(), f'sent transaction {text}')
+                self.assertEqual(record.signature, text)
@@ -0,0 +1,69 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Run each test from the agents app migrated back to `migrate_from`, and migrate it forward again after."""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.apps = self.migrate([self.migrate_from])
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes('agents'))
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class CopyChatHistoryToMessagesTests(MigrationTestCase):
+    migrate_from = ('agents', '0005_chatmessage')
+    migrate_to = ('agents', '0006_copy_chat_history_to_messages')
+
+    history = [
+        {'role': 'user', 'content': 'What are you guarding?'},
+        {'role': 'assistant', 'content': 'Nothing you need to know about.'},
+        {'role': 'user', 'content': None},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        User = self.apps.get_model('agents', 'User')
+        Agent = self.apps.get_model('agents', 'Agent')
+        ChatHistory = self.apps.get_model('agents', 'ChatHistory')
+        user = User.objects.create(wallet_address='user')
+        agent = Agent.objects.create(creator=user, name='agent', wallet_address='agent', private_key='key')
+        self.conversation_id = ChatHistory.objects.create(agent=agent, user=user, chat_history=self.history).pk
+        self.empty_id = ChatHistory.objects.create(agent=agent, user=User.objects.create(wallet_address='other')).pk
+
+    def test_history_is_copied_to_rows_and_back(self):
+        apps = self.migrate([self.migrate_to])
+        ChatHistory = apps.get_model('agents', 'ChatHistory')
+        ChatMessage = apps.get_model('agents', 'ChatMessage')
+        self.assertEqual(ChatHistory.objects.get(pk=self.conversation_id).message_count, 3)
+        self.assertEqual(ChatHistory.objects.get(pk=self.empty_id).message_count, 0)
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('sequence').values_list('conversation_id', 'sequence', 'role', 'content')),
+            [
+                (self.conversation_id, 0, 'user', 'What are you guarding?'),
+                (self.conversation_id, 1, 'assistant', 'Nothing you need to know about.'),
+                (self.conversation_id, 2, 'user', ''),
+            ]
+        )
+
+        apps = self.migrate([self.migrate_from])
+        ChatHistory = apps.get_model('agents', 'ChatHistory')
+        ChatMessage = apps.get_model('agents', 'ChatMessage')
+        self.assertFalse(ChatMessage.objects.exists())
+        self.assertEqual(ChatHistory.objects.get(pk=self.conversation_id).chat_history, [
+            {'role': 'user', 'content': 'What are you guarding?'},
+            {'role': 'assistant', 'content': 'Nothing you need to know about.'},
+            {'role': 'user', 'content': ''},
+        ])
+        self.assertEqual(ChatHistory.objects.get(pk=self.empty_id).chat_history, [])
@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from solders.keypair import Keypair
+
+from agents import rpc
+from agents.blockhash import blockhash_cache
+from agents.fake_rpc import FakeSolanaRPC
+from agents.models import Agent, ChatHistory, PayoutJob, User
+from agents.payouts import poll_sent_jobs, send_pending_jobs
+from agents.solana import LAMPORTS_PER_SOL, generate_wallet
+
+
+@override_settings(PAYOUT_MAX_ATTEMPTS=2, PAYOUT_RETRY_BACKOFF=5, PAYOUT_LEASE=60)
+class PayoutJobTests(TestCase):
+    def setUp(self):
+        self.wallet, private_key = generate_wallet()
+        self.recipient = str(Keypair().pubkey())
+        user = User.objects.create(wallet_address=self.recipient)
+        agent = Agent.objects.create(creator=user, name='agent', wallet_address=self.wallet, private_key=private_key)
+        conversation = ChatHistory.objects.create(agent=agent, user=user, triggered_secret_task=True)
+        self.job = PayoutJob.objects.create(
+            chat_history=conversation, agent=agent, recipient_wallet=self.recipient, amount=0.5
+        )
+
+    @contextlib.asynccontextmanager
+    async def chain(self, balance=1.0, slot_time=0.01):
+        """A fake RPC node, holding `balance` SOL in the agent's wallet, that the app talks to."""
+        fake_rpc = FakeSolanaRPC(balances={self.wallet: int(balance * LAMPORTS_PER_SOL)}, slot_time=slot_time)
+        await fake_rpc.start()
+        # Don't reuse a blockhash from another test's node
+        blockhash_cache.invalidate()
+        try:
+            with override_settings(SOLANA_RPC_URL=fake_rpc.url):
+                yield fake_rpc
+        finally:
+            await rpc.aclose()
+            await fake_rpc.stop()
+
+    async def refresh_job(self):
+        await self.job.arefresh_from_db()
+        return self.job
+
+    async def test_sent_then_confirmed(self):
+        async with self.chain() as fake_rpc:
+            self.assertEqual(await send_pending_jobs(batch_size=10), 1)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.SENT)
+            self.assertEqual(job.attempts, 1)
+            self.assertIn(job.signature, fake_rpc.transactions)
+            self.assertEqual(fake_rpc.balances[self.recipient], LAMPORTS_PER_SOL // 2)
+
+            # Wait for the transaction to be a block deep
+            await asyncio.sleep(0.05)
+            with self.assertLogs('agents.payouts', 'INFO'):
+                await poll_sent_jobs()
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.CONFIRMED)
+            self.assertIsNotNone(job.confirmed_at)
+
+            # Nothing left to claim
+            self.assertEqual(await send_pending_jobs(batch_size=10), 0)
+
+    async def test_unconfirmed_job_stays_sent(self):
+        async with self.chain(slot_time=60):
+            await send_pending_jobs(batch_size=10)
+            await poll_sent_jobs()
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.SENT)
+
+    async def test_rejected_send_is_retried_then_fails(self):
+        # Not enough SOL: the node rejects the transaction in preflight
+        async with self.chain(balance=0.1):
+            with self.assertLogs('agents.payouts', 'WARNING'):
+                await send_pending_jobs(batch_size=10)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.PENDING)
+            self.assertEqual(job.signature, '')
+            self.assertIn('simulation failed', job.last_error)
+            self.assertGreater(job.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(await send_pending_jobs(batch_size=10), 0)
+
+            job.next_attempt_at = timezone.now()
+            await job.asave()
+            with self.assertLogs('agents.payouts', 'WARNING'):
+                await send_pending_jobs(batch_size=10)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.FAILED)
+            self.assertEqual(job.attempts, 2)
+
+    async def test_nothing_to_pay_out_fails_without_retrying(self):
+        self.job.amount = -1.0
+        await self.job.asave()
+        async with self.chain(balance=0):
+            await send_pending_jobs(batch_size=10)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.FAILED)
+            self.assertEqual(job.last_error, 'Insufficient balance for transfer')
+
+    async def test_expired_transaction_is_retried(self):
+        # Recorded as sent, but the node never saw it and its blockhash has expired
+        self.job.status = PayoutJob.SENT
+        self.job.attempts = 1
+        self.job.signature = str(Keypair().sign_message(b'never sent'))
+        self.job.last_valid_block_height = 0
+        await self.job.asave()
+        async with self.chain():
+            with self.assertLogs('agents.payouts', 'WARNING'):
+                await poll_sent_jobs()
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.PENDING)
+            self.assertEqual(job.signature, '')
+            self.assertEqual(job.last_error, 'Transaction expired before it was confirmed')
+
+    async def test_job_of_a_dead_worker_is_polled_not_resent(self):
+        # A worker recorded the signature, then died before its lease ran out
+        self.job.status = PayoutJob.SENDING
+        self.job.attempts = 1
+        self.job.signature = str(Keypair().sign_message(b'maybe sent'))
+        self.job.locked_until = timezone.now() + timedelta(seconds=60)
+        await self.job.asave()
+        async with self.chain() as fake_rpc:
+            # Still leased
+            self.assertEqual(await send_pending_jobs(batch_size=10), 0)
+
+            self.job.locked_until = timezone.now() - timedelta(seconds=1)
+            await self.job.asave(update_fields=['locked_until'])
+            self.assertEqual(await send_pending_jobs(batch_size=10), 1)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.SENT)
+            self.assertEqual(job.attempts, 1)
+            self.assertEqual(fake_rpc.transactions, {})
+
+    async def test_concurrent_pollers_record_a_confirmation_once(self):
+        async with self.chain():
+            await send_pending_jobs(batch_size=10)
+            await asyncio.sleep(0.05)
+            with self.assertLogs('agents.payouts', 'INFO') as logs:
+                await asyncio.gather(poll_sent_jobs(), poll_sent_jobs())
+            self.assertEqual(len([line for line in logs.output if 'confirmed' in line]), 1)
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.CONFIRMED)
+
+    async def test_poller_does_not_undo_another_workers_confirmation(self):
+        self.job.status = PayoutJob.SENT
+        self.job.attempts = 1
+        self.job.signature = str(Keypair().sign_message(b'sent'))
+        self.job.last_valid_block_height = 0
+        await self.job.asave()
+
+        async def statuses_seen_before_the_other_worker_confirmed(signatures):
+            # Another worker confirms the job while this one's lookup is in flight
+            await PayoutJob.objects.filter(pk=self.job.pk).aupdate(status=PayoutJob.CONFIRMED)
+            return [None] * len(signatures)
+
+        async with self.chain():
+            with mock.patch('agents.payouts.aget_signature_statuses', statuses_seen_before_the_other_worker_confirmed):
+                await poll_sent_jobs()
+            job = await self.refresh_job()
+            self.assertEqual(job.status, PayoutJob.CONFIRMED)
+            self.assertEqual(job.signature, self.job.signature)
+            self.assertEqual(job.last_error, '')
@@ -0,0 +1,48 @@
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+
+from agents.models import Agent, ChatHistory, ChatMessage, PayoutJob, User
+from agents.partitions import TABLE as CHAT_MESSAGE_TABLE
+
+
+def hot_queries():
+    """The lookups made on every request, keyed by a description."""
+    now = timezone.now()
+    return {
+        'agent by wallet_address': Agent.objects.filter(wallet_address='x'),
+        'user by wallet_address': User.objects.filter(wallet_address='x'),
+        'conversation by (agent, user)': ChatHistory.objects.filter(agent_id=1, user_id=1),
+        'active agents by expires_at': Agent.objects.filter(expires_at__gt=now),
+        'agent list page by (created_at, id)': Agent.objects.filter(
+            Q(created_at__gt=now) | Q(created_at=now, id__gt=1), expires_at__gt=now
+        ).order_by('created_at', 'id')[:51],
+        'conversation tail': ChatMessage.objects.filter(
+            conversation_id=1, agent_id=1, conversation_started_at=now, sequence__gte=10
+        ),
+        'due payouts': PayoutJob.objects.filter(status=PayoutJob.PENDING, next_attempt_at__lte=now),
+    }
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked on PostgreSQL')
+class HotQueryPlanTests(TestCase):
+    def setUp(self):
+        # On small tables a sequential scan is always cheapest, so take it
+        # off the table: if a query still seq-scans, no index can serve it
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_hot_queries_use_an_index(self):
+        for name, queryset in hot_queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertNotIn('Seq Scan', plan, plan)
+
+    def test_conversation_tail_reads_a_single_partition(self):
+        plan = hot_queries()['conversation tail'].explain()
+        partitions = set(re.findall(rf' on ({CHAT_MESSAGE_TABLE}_\w+)', plan))
+        self.assertEqual(len(partitions), 1, plan)
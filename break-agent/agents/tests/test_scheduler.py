@@ -0,0 +1,111 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from agents._agent.providers import RateLimited
+from agents._agent.scheduler import LLMOverloaded, LLMScheduler
+
+
+def scheduler(max_concurrency=1, max_queue=100, max_retries=0):
+    # No rate limits, so the order is decided by the queues alone
+    return LLMScheduler(max_concurrency=max_concurrency, max_queue=max_queue, requests_per_minute=0,
+                        tokens_per_minute=0, max_retries=max_retries, backoff=0.01, max_backoff=0.01)
+
+
+class LLMSchedulerTests(SimpleTestCase):
+    async def test_users_take_turns(self):
+        s = scheduler()
+        order = []
+
+        async def call(user):
+            order.append(user)
+            await asyncio.sleep(0)
+
+        # One user queues a burst, then two others send two requests each
+        tasks = [asyncio.create_task(s.run(lambda: call('a'), user='a')) for _ in range(6)]
+        await asyncio.sleep(0)
+        for user in 'bcbc':
+            tasks.append(asyncio.create_task(s.run(lambda user=user: call(user), user=user)))
+        await asyncio.gather(*tasks)
+        self.assertEqual(''.join(order), 'aabcabcaaa')
+        self.assertEqual(s.stats()['completed'], 10)
+
+    async def test_sheds_once_the_queue_is_full(self):
+        s = scheduler(max_queue=2)
+        release = asyncio.Event()
+
+        async def hold():
+            async with s.slot('a'):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold()) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(s.stats()['running'], 1)
+        self.assertEqual(s.stats()['queued'], 2)
+
+        with self.assertRaises(LLMOverloaded):
+            s.check_capacity()
+        with self.assertRaises(LLMOverloaded):
+            async with s.slot('b'):
+                pass
+        self.assertEqual(s.stats()['shed'], 2)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(s.stats()['running'], 0)
+        self.assertEqual(s.stats()['queued'], 0)
+        s.check_capacity()
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        s = scheduler(max_queue=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with s.slot('a'):
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        self.assertEqual(s.stats()['queued'], 1)
+
+        queued.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await queued
+        self.assertEqual(s.stats()['queued'], 0)
+        # Its place in the queue is free again
+        s.check_capacity()
+
+        release.set()
+        await running
+        self.assertEqual(s.stats()['running'], 0)
+
+    async def test_rate_limited_requests_are_retried(self):
+        s = scheduler(max_retries=2)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise RateLimited('429', retry_after=0.01)
+            return 'ok'
+
+        with self.assertLogs('agents._agent.scheduler', 'INFO'):
+            self.assertEqual(await s.run(call), 'ok')
+        self.assertEqual(attempts, 3)
+        self.assertEqual(s.stats()['retries'], 2)
+        self.assertEqual(s.stats()['rate_limited'], 2)
+
+    async def test_gives_up_after_max_retries(self):
+        s = scheduler(max_retries=1)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            raise RateLimited('429', retry_after=0.01)
+
+        with self.assertLogs('agents._agent.scheduler', 'INFO'), self.assertRaises(RateLimited):
+            await s.run(call)
+        self.assertEqual(attempts, 2)
@@ -0,0 +1,130 @@
+import asyncio
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from agents.throttling import ChatThrottle, _seconds_until_allowed
+
+
+def weighted_count(previous, current, elapsed, window):
+    return previous * (1 - elapsed / window) + current
+
+
+class SecondsUntilAllowedTests(SimpleTestCase):
+    window = 60.0
+    limit = 10
+
+    def assert_allowed_after(self, previous, current, elapsed):
+        wait = _seconds_until_allowed(previous, current, elapsed, self.window, self.limit)
+        later = elapsed + wait
+        if later < self.window:
+            before = weighted_count(previous, current, later - 0.01, self.window)
+            after = weighted_count(previous, current, later + 0.01, self.window)
+        else:
+            # The current window has become the previous one
+            before = weighted_count(current, 0, later - self.window - 0.01, self.window)
+            after = weighted_count(current, 0, later - self.window + 0.01, self.window)
+        self.assertGreaterEqual(before, self.limit)
+        self.assertLess(after, self.limit)
+        return wait
+
+    def test_waits_for_the_previous_window_to_slide_out(self):
+        # 12 * (1 - f) + 4 < 10 once f > 0.5, i.e. 30s into the window
+        self.assertAlmostEqual(self.assert_allowed_after(previous=12, current=4, elapsed=10), 20)
+
+    def test_full_current_window_waits_past_its_end(self):
+        # The next window starts with 10 * (1 - f) >= 10 until just after it begins
+        self.assertAlmostEqual(self.assert_allowed_after(previous=0, current=10, elapsed=15), 45)
+        # 20 * (1 - f) < 10 once half of the next window has passed
+        self.assertAlmostEqual(self.assert_allowed_after(previous=3, current=20, elapsed=15), 75)
+
+    def test_never_negative(self):
+        self.assertEqual(_seconds_until_allowed(previous=10, current=0, elapsed=59, window=60, limit=10), 0.0)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle-tests'},
+})
+class ChatThrottleTests(SimpleTestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        # The throttle and the cache's expiry both read time.time()
+        self.now = 6000.0
+        patcher = mock.patch('time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def throttle(self, limit=0, window=60, cooldown=0):
+        return ChatThrottle(limit=limit, window=window, cooldown=cooldown, alias='throttle')
+
+    async def test_allows_up_to_the_limit(self):
+        throttle = self.throttle(limit=3)
+        for _ in range(3):
+            self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+        result = await throttle.hit('user', 'agent')
+        self.assertFalse(result.allowed)
+        self.assertEqual(result.reason, 'limit')
+        # Three in the current window: blocked until just after it ends
+        self.assertAlmostEqual(result.retry_after, 60)
+
+    async def test_allowed_again_after_retry_after(self):
+        throttle = self.throttle(limit=3)
+        for _ in range(3):
+            await throttle.hit('user', 'agent')
+        self.now += 30
+        result = await throttle.hit('user', 'agent')
+        self.assertFalse(result.allowed)
+        self.now += result.retry_after + 0.01
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+
+    async def test_concurrent_burst_gets_exactly_the_limit(self):
+        throttle = self.throttle(limit=5)
+        results = await asyncio.gather(*(throttle.hit('user', 'agent') for _ in range(5 + 20)))
+        self.assertEqual(sum(result.allowed for result in results), 5)
+        self.assertTrue(all(result.reason == 'limit' for result in results if not result.allowed))
+        # Rejected messages gave their count back: halfway into the next window
+        # 5 * 0.5 still count, where 25 * 0.5 would block everything
+        self.now += 90
+        self.assertEqual(sum([(await throttle.hit('user', 'agent')).allowed for _ in range(6)]), 3)
+
+    async def test_previous_window_counts_while_it_overlaps(self):
+        throttle = self.throttle(limit=4)
+        for _ in range(4):
+            await throttle.hit('user', 'agent')
+        # A quarter into the next window, 4 * 0.75 = 3 still count
+        self.now += 75
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+        self.assertFalse((await throttle.hit('user', 'agent')).allowed)
+
+    async def test_limits_each_user_and_agent_pair_separately(self):
+        throttle = self.throttle(limit=1)
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+        self.assertFalse((await throttle.hit('user', 'agent')).allowed)
+        self.assertTrue((await throttle.hit('user', 'agent2')).allowed)
+        self.assertTrue((await throttle.hit('user2', 'agent')).allowed)
+
+    async def test_cooldown(self):
+        throttle = self.throttle(cooldown=5)
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+        self.now += 2
+        result = await throttle.hit('user', 'agent')
+        self.assertFalse(result.allowed)
+        self.assertEqual(result.reason, 'cooldown')
+        self.assertAlmostEqual(result.retry_after, 3)
+        self.now += 3
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+
+    async def test_rejected_messages_are_not_counted(self):
+        throttle = self.throttle(limit=2, cooldown=5)
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+        for _ in range(5):
+            self.assertFalse((await throttle.hit('user', 'agent')).allowed)
+        self.now += 5
+        self.assertTrue((await throttle.hit('user', 'agent')).allowed)
+
+    async def test_disabled(self):
+        throttle = self.throttle()
+        for _ in range(10):
+            self.assertTrue((await throttle.hit('user', 'agent')).allowed)
@@ -0,0 +1,115 @@
+"""
+Chat attempt limits.
+
+Each (user, agent) pair may send CHAT_RATE_LIMIT messages per
+CHAT_RATE_LIMIT_WINDOW seconds, and must wait CHAT_COOLDOWN seconds between
+messages. The views check this before any DB, RPC or LLM work, so an
+over-limit request costs a few cache round trips.
+
+Counts are kept in the CHAT_THROTTLE_CACHE_ALIAS cache, so with a shared
+cache such as Redis the limits hold across workers. The window is a sliding
+window counter: the previous fixed window's count, weighted by how much of it
+still overlaps the sliding window, plus the current window's count.
+
+A message is counted before it is checked: the atomic increment hands each of
+a burst of concurrent requests a different count, so no more than the limit
+get through, and a rejected message gives its count back.
+"""
+import math
+import time
+from typing import NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'chat-throttle'
+
+
+class ThrottleResult(NamedTuple):
+    allowed: bool
+    # Seconds until the next message would be allowed (0 if allowed)
+    retry_after: float
+    reason: Optional[str] = None
+
+
+def _seconds_until_allowed(previous: int, current: int, elapsed: float, window: float, limit: int) -> float:
+    """
+    How long until previous * (1 - f) + current drops below limit, where f is
+    the fraction of the current window that has passed.
+    """
+    if current < limit:
+        needed = 1 - (limit - current) / previous
+        return max(needed * window - elapsed, 0.0)
+    # Not until the current window is the previous one
+    needed = 1 - limit / current
+    return window - elapsed + needed * window
+
+
+class ChatThrottle:
+    def __init__(self, limit: int = None, window: float = None, cooldown: float = None, alias: str = None):
+        self.limit = limit
+        self.window = window
+        self.cooldown = cooldown
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias or settings.CHAT_THROTTLE_CACHE_ALIAS]
+
+    async def _reserve(self, current_key: str, window: float) -> int:
+        """Count a message in the current window. Returns the new count, this message included."""
+        cache = self.cache
+        # Each window's count is needed until the end of the next one
+        if await cache.aadd(current_key, 1, math.ceil(2 * window)):
+            return 1
+        try:
+            # BaseCache.aincr is a get and a set; the backends' incr is atomic
+            return await sync_to_async(cache.incr)(current_key)
+        except ValueError:
+            # Expired between the add and the incr
+            await cache.aset(current_key, 1, math.ceil(2 * window))
+            return 1
+
+    async def _release(self, current_key: str) -> None:
+        """Take back a message counted by _reserve that was then rejected."""
+        try:
+            await sync_to_async(self.cache.decr)(current_key)
+        except ValueError:
+            pass
+
+    async def hit(self, user_wallet: str, agent_wallet: str) -> ThrottleResult:
+        """Count a message from user_wallet to agent_wallet, unless it is over the limit."""
+        limit = settings.CHAT_RATE_LIMIT if self.limit is None else self.limit
+        window = self.window or settings.CHAT_RATE_LIMIT_WINDOW
+        cooldown = settings.CHAT_COOLDOWN if self.cooldown is None else self.cooldown
+        cache = self.cache
+        key = f'{KEY_PREFIX}:{user_wallet}:{agent_wallet}'
+        now = time.time()
+
+        if limit:
+            number = int(now // window)
+            elapsed = now - number * window
+            current_key, previous_key = f'{key}:{number}', f'{key}:{number - 1}'
+            current = await self._reserve(current_key, window) - 1
+            previous = await cache.aget(previous_key, 0)
+            if previous * (1 - elapsed / window) + current >= limit:
+                await self._release(current_key)
+                return ThrottleResult(False, _seconds_until_allowed(previous, current, elapsed, window, limit), 'limit')
+
+        if cooldown:
+            # add() only succeeds if the key is absent, i.e. the cooldown has run out
+            if not await cache.aadd(f'{key}:last', now, math.ceil(cooldown)):
+                last = await cache.aget(f'{key}:last', now)
+                wait = cooldown - (now - last)
+                if wait > 0:
+                    if limit:
+                        await self._release(current_key)
+                    return ThrottleResult(False, wait, 'cooldown')
+                # The key outlived the cooldown by the rounding of its timeout
+                await cache.aset(f'{key}:last', now, math.ceil(cooldown))
+
+        return ThrottleResult(True, 0.0)
+
+
+chat_throttle = ChatThrottle()
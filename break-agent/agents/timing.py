@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from .metrics import REQUEST_PHASE_SECONDS
+
+
+class PhaseTimer:
+    """
+    Records how long each phase of a request takes and renders it as a
+    Server-Timing header, e.g. `db;dur=1.8, llm;dur=812.4, total;dur=815.0`.
+
+    Phases may overlap (e.g. a background balance fetch during the LLM call),
+    so the phase durations don't necessarily add up to the total.
+
+    Each phase, and the total, is also recorded in the
+    agents_request_phase_seconds histogram under `view`.
+    """
+
+    def __init__(self, view: str = ''):
+        self.view = view
+        self.started_at = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0) + duration
+            REQUEST_PHASE_SECONDS.observe(duration, view=self.view, phase=name)
+
+    def header(self) -> str:
+        durations = dict(self.durations, total=time.perf_counter() - self.started_at)
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+    def apply(self, response):
+        response['Server-Timing'] = self.header()
+        REQUEST_PHASE_SECONDS.observe(time.perf_counter() - self.started_at, view=self.view, phase='total')
+        return response
@@ -9,6 +9,9 @@ urlpatterns = [
     path('agents/list/', list_agents, name='list_agents'),
     path('agents/create/', create_agent, name='create_agent'),
     path('agents/chat/', get_agent_response, name='get_agent_response'),
+    path('agents/chat/stream/', get_agent_response_stream, name='get_agent_response_stream'),
     path('agents/transfer/', transfer, name='transfer'),
+    path('payouts/status/', payout_status, name='payout_status'),
+    path('metrics/', metrics, name='metrics'),
 ]
 
@@ -1,38 +1,34 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
 import json
-import httpx
+import logging
+import math
+import asyncio
 from datetime import datetime, timedelta
 
-from solders.pubkey import Pubkey
+from asgiref.sync import sync_to_async
 
 from .models import *
-from .solana import generate_wallet, transfer_sol, LAMPORTS_PER_SOL
-from ._agent.chat import get_response, get_secret_task, initialize_history
-
-async def get_solana_balance(wallet_address: str) -> float:
-    """Get balance for a Solana wallet using direct RPC call."""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.devnet.solana.com",
-                json={
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "getBalance",
-                    "params": [wallet_address]
-                }
-            )
-            data = response.json()
-            if 'result' in data and 'value' in data['result']:
-                return float(data['result']['value']) / LAMPORTS_PER_SOL
-            return 0
-    except Exception as e:
-        print(f"Error getting balance for wallet {wallet_address}: {str(e)}")
-        return 0
+from .solana import atransfer_sol
+from .balances import get_cached_balances
+from .catalogue import catalogue
+from .prompts import prompt_cache, prompt_cache_key
+from .metrics import CHAT_THROTTLED, is_enabled as metrics_enabled, render as render_metrics
+from .throttling import chat_throttle
+from .timing import PhaseTimer
+from .wallet_pool import claim_or_generate_wallet
+from .conversations import aappend_messages, aget_context_messages, aget_or_start_conversation
+from ._agent.chat import count_function_tokens, fit_history, get_response, get_response_stream
+from ._agent.providers import RateLimited
+from ._agent.scheduler import LLMOverloaded, get_scheduler
+
+logger = logging.getLogger(__name__)
 
 @csrf_exempt
 async def test(request):
@@ -71,6 +67,19 @@ async def create_user(request):
             'message': str(e)
         })
 
+@sync_to_async
+def _create_agent(creator_wallet, **fields):
+    # One transaction, so an agent that fails to save hands its wallet back to the pool
+    with transaction.atomic():
+        creator = User.objects.get(wallet_address=creator_wallet)
+        public_key, private_key = claim_or_generate_wallet()
+        return Agent.objects.create(
+            creator=creator,
+            wallet_address=public_key,
+            private_key=private_key,
+            **fields
+        )
+
 @csrf_exempt
 async def create_agent(request):
     """ 
@@ -88,7 +97,7 @@ async def create_agent(request):
         secret_task = json.loads(data.get('secret_task', '{}'))
         
         # Optional: expires_at (default 30 days from now)
-        expires_at = datetime.now() + timedelta(days=30)
+        expires_at = timezone.now() + timedelta(days=30)
         if data.get('expires_at'):
             expires_at = datetime.fromisoformat(data.get('expires_at'))
 
@@ -99,25 +108,16 @@ async def create_agent(request):
                 'message': 'Missing required fields: wallet_address and name'
             })
 
-        # Get creator user
-        creator = await User.objects.aget(wallet_address=creator_wallet)
-        
-        # Generate Solana wallet for agent
-        public_key, private_key = generate_wallet()
-        
-        # Create and save agent
-        agent = Agent(
-            creator=creator,
+        # Look up the creator, take a pre-generated wallet and save the agent
+        agent = await _create_agent(
+            creator_wallet,
             name=name,
             personality=personality,
             lore=lore,
             behavior=behavior,
             secret_task=secret_task,
-            wallet_address=public_key,
-            private_key=private_key,
             expires_at=expires_at
         )
-        await agent.asave()
 
         return JsonResponse({
             'success': True,
@@ -148,6 +148,80 @@ async def create_agent(request):
             'message': str(e)
         })
 
+async def _timed_balances(timer, wallet_addresses):
+    with timer.phase('balances'):
+        return await get_cached_balances(wallet_addresses)
+
+async def _get_conversation(agent_wallet, user_wallet):
+    """
+    Look up the agent, its compiled prompt and the user, and get or start
+    their conversation.
+    """
+    # The prompt comes from the per-worker prompt cache, so skip the agent's JSON blobs
+    agent = await Agent.objects.only('id', 'wallet_address', 'prompt_hash').aget(wallet_address=agent_wallet)
+    prompt = await prompt_cache.get(agent)
+    user = await User.objects.aget(wallet_address=user_wallet)
+
+    # Try to get existing chat history or create new one
+    chat_history = await aget_or_start_conversation(agent, user)
+    return agent, prompt, user, chat_history
+
+async def _queue_payout(agent, user, chat_history):
+    """
+    Queue the payout for a completed secret task if it hasn't been triggered
+    before; run_payouts sends it and tracks confirmation.
+    """
+    if chat_history.triggered_secret_task:
+        return None
+    payout_job, _ = await PayoutJob.objects.aget_or_create(
+        chat_history=chat_history,
+        defaults={
+            'agent': agent,
+            'recipient_wallet': user.wallet_address,
+            'amount': -1.0
+        }
+    )
+    await ChatHistory.objects.filter(pk=chat_history.pk).aupdate(triggered_secret_task=True)
+    chat_history.triggered_secret_task = True
+    return payout_job
+
+@sync_to_async
+def _release_db_connection():
+    """
+    Hand the request's pooled DB connection back before the LLM call, so
+    requests waiting on the LLM don't hold pool connections idle. The next
+    query takes a connection from the pool again.
+    """
+    if getattr(connection, 'pool', None) is not None:
+        connection.close()
+
+def _throttled_response(throttle):
+    """A 429 for a user sending messages to an agent too fast."""
+    CHAT_THROTTLED.inc(reason=throttle.reason)
+    message = (
+        'Please wait before sending another message'
+        if throttle.reason == 'cooldown' else
+        'Too many messages to this agent, please try again later'
+    )
+    response = JsonResponse({
+        'success': False,
+        'message': message,
+        'retry_after': throttle.retry_after
+    }, status=429)
+    response['Retry-After'] = str(max(math.ceil(throttle.retry_after), 1))
+    return response
+
+def _llm_error_response(e):
+    """A 503 when the scheduler shed the request, or a 429 when the provider kept rate limiting it."""
+    response = JsonResponse({
+        'success': False,
+        'message': str(e),
+        'retry_after': e.retry_after
+    }, status=503 if isinstance(e, LLMOverloaded) else 429)
+    if e.retry_after:
+        response['Retry-After'] = str(max(math.ceil(e.retry_after), 1))
+    return response
+
 @csrf_exempt
 async def get_agent_response(request):
     """
@@ -157,7 +231,15 @@ async def get_agent_response(request):
     - agent_wallet: str - Agent's wallet address
     - user_wallet: str - User's wallet address
     - message: str - User's message to the agent
+
+    The response carries a Server-Timing header with the duration of each phase.
+    A user sending more than CHAT_RATE_LIMIT messages per window to the agent,
+    or messaging again within CHAT_COOLDOWN, gets a 429. If too many requests
+    are already waiting for the LLM it is a 503, and if the provider keeps
+    rate limiting the request a 429. All of these carry Retry-After.
     """
+    timer = PhaseTimer('get_agent_response')
+    balances_task = None
     try:
         data = request.POST
         agent_wallet = data.get('agent_wallet')
@@ -167,82 +249,250 @@ async def get_agent_response(request):
 
         # Validate required fields
         if not all([agent_wallet, user_wallet, message]):
-            return JsonResponse({
+            return timer.apply(JsonResponse({
                 'success': False,
                 'message': 'Missing required fields: agent_wallet, user_wallet, and message'
-            })
-
-        # Get agent and user
-        agent = await Agent.objects.aget(wallet_address=agent_wallet)
-        user = await User.objects.aget(wallet_address=user_wallet)
-
-        # Get wallet balances
-        agent_balance = await get_solana_balance(agent_wallet)
-        user_balance = await get_solana_balance(user_wallet)
-
-        # Try to get existing chat history or create new one
-        chat_history, created = await ChatHistory.objects.aget_or_create(
-            agent=agent,
-            user=user,
-            defaults={
-                'chat_history': initialize_history(agent),
-                'secret_task_schema': get_secret_task(agent)
-            }
-        )
-
-        # Get current history or initialize if empty
-        history = chat_history.chat_history if not created else chat_history.chat_history
-        secret_task_schema = chat_history.secret_task_schema
+            }))
+
+        # Turn the request away before any work if the user is over their
+        # attempt limit for this agent or the LLM queue is already full
+        throttle = await chat_throttle.hit(user_wallet, agent_wallet)
+        if not throttle.allowed:
+            return timer.apply(_throttled_response(throttle))
+        get_scheduler().check_capacity()
+
+        # Fetch wallet balances in the background; they're only needed for the
+        # response, so they overlap with the DB lookups and the LLM call
+        balances_task = asyncio.ensure_future(_timed_balances(timer, [agent_wallet, user_wallet]))
+
+        # Get agent, user and their conversation
+        with timer.phase('db'):
+            agent, prompt, user, chat_history = await _get_conversation(agent_wallet, user_wallet)
+
+        # Load the system prompt and recent messages
+        with timer.phase('history'):
+            history = await aget_context_messages(
+                chat_history, prompt.system_prompt, settings.CHAT_CONTEXT_MAX_MESSAGES
+            )
+        secret_task_schema = prompt.secret_task_schema
 
         # Add user message to history
-        history.append({
+        user_message = {
             "role": "user",
             "content": message
-        })
+        }
+        history.append(user_message)
 
-        print(f"history: {history}")
+        # Only send as much of the history as fits the token budget
+        context, token_counts = fit_history(
+            history, settings.CHAT_CONTEXT_TOKEN_BUDGET, count_function_tokens(secret_task_schema),
+            block_size=settings.CHAT_CONTEXT_TRIM_BLOCK
+        )
+
+        await _release_db_connection()
 
         # Get response from agent
-        response, secret_task_completed = await get_response(history, secret_task_schema)
+        with timer.phase('llm'):
+            response, secret_task_completed, usage = await get_response(
+                context, secret_task_schema, cache_key=prompt_cache_key(agent), user=user_wallet
+            )
+        token_counts['cached_tokens'] = usage['cached_tokens']
+
+        # If the secret task is completed, queue the payout
+        payout_job = None
+        if secret_task_completed:
+            with timer.phase('payout'):
+                payout_job = await _queue_payout(agent, user, chat_history)
+
+        # Add the turn to the conversation
+        with timer.phase('save'):
+            await aappend_messages(chat_history, [
+                user_message,
+                {
+                    "role": "assistant",
+                    "content": response,
+                    **usage
+                }
+            ])
 
-        # If the secret task is completed and hasn't been triggered before
-        if secret_task_completed and not chat_history.triggered_secret_task:
-            await transfer_sol(agent.private_key, user.wallet_address, -1.0)
-            chat_history.triggered_secret_task = True
+        # Normally already finished; this only waits if the RPC was slower than the LLM
+        with timer.phase('balances_wait'):
+            balances = await balances_task
 
-        # Add response to history and save
-        history.append({
-            "role": "assistant",
-            "content": response
+        logger.info("Chat response", extra={
+            'agent_wallet': agent_wallet,
+            'user_wallet': user_wallet,
+            'secret_task_completed': secret_task_completed,
+            'tokens': token_counts,
+            'timings': timer.header(),
         })
-        chat_history.chat_history = history
-        await chat_history.asave()
 
-        return JsonResponse({
+        return timer.apply(JsonResponse({
             'success': True,
             'message': 'Response generated successfully',
             'response': response,
             'secret_task_completed': secret_task_completed,
-            'agent_balance': agent_balance,
-            'user_balance': user_balance
+            'payout_job_id': payout_job.id if payout_job else None,
+            'agent_balance': balances[agent_wallet],
+            'user_balance': balances[user_wallet],
+            'tokens': token_counts
+        }))
+
+    except Agent.DoesNotExist:
+        return timer.apply(JsonResponse({
+            'success': False,
+            'message': 'Agent not found'
+        }))
+    except User.DoesNotExist:
+        return timer.apply(JsonResponse({
+            'success': False,
+            'message': 'User not found'
+        }))
+    except (LLMOverloaded, RateLimited) as e:
+        return timer.apply(_llm_error_response(e))
+    except Exception as e:
+        logger.exception("Error in get_agent_response")
+        return timer.apply(JsonResponse({
+            'success': False,
+            'message': str(e)
+        }))
+    finally:
+        if balances_task is not None and not balances_task.done():
+            balances_task.cancel()
+    
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@csrf_exempt
+async def get_agent_response_stream(request):
+    """
+    Chat with an agent, streaming the response as server-sent events.
+
+    Expected POST parameters are the same as get_agent_response.
+
+    Events:
+    - token: {"content": str} for each piece of the response as it arrives
+    - done: the same payload get_agent_response returns, sent once the history
+      has been saved
+    - error: {"success": false, "message": str}, plus "retry_after" (seconds)
+      if the LLM was overloaded or rate limited
+
+    The history is only saved once the model's stream has finished.
+    """
+    data = request.POST
+    agent_wallet = data.get('agent_wallet')
+    user_wallet = data.get('user_wallet')
+    message = data.get('message')
+
+    # Validate required fields
+    if not all([agent_wallet, user_wallet, message]):
+        return JsonResponse({
+            'success': False,
+            'message': 'Missing required fields: agent_wallet, user_wallet, and message'
         })
 
+    throttle = await chat_throttle.hit(user_wallet, agent_wallet)
+    if not throttle.allowed:
+        return _throttled_response(throttle)
+    try:
+        get_scheduler().check_capacity()
+    except LLMOverloaded as e:
+        return _llm_error_response(e)
+
+    balances_task = asyncio.ensure_future(get_cached_balances([agent_wallet, user_wallet]))
+
+    try:
+        agent, prompt, user, chat_history = await _get_conversation(agent_wallet, user_wallet)
     except Agent.DoesNotExist:
+        balances_task.cancel()
         return JsonResponse({
             'success': False,
             'message': 'Agent not found'
         })
     except User.DoesNotExist:
+        balances_task.cancel()
         return JsonResponse({
             'success': False,
             'message': 'User not found'
         })
     except Exception as e:
+        balances_task.cancel()
         return JsonResponse({
             'success': False,
             'message': str(e)
         })
-    
+
+    history = await aget_context_messages(chat_history, prompt.system_prompt, settings.CHAT_CONTEXT_MAX_MESSAGES)
+    user_message = {
+        "role": "user",
+        "content": message
+    }
+    history.append(user_message)
+
+    # Only send as much of the history as fits the token budget
+    context, token_counts = fit_history(
+        history, settings.CHAT_CONTEXT_TOKEN_BUDGET, count_function_tokens(prompt.secret_task_schema),
+        block_size=settings.CHAT_CONTEXT_TRIM_BLOCK
+    )
+
+    async def events():
+        try:
+            await _release_db_connection()
+            async for kind, value in get_response_stream(
+                context, prompt.secret_task_schema, cache_key=prompt_cache_key(agent), user=user_wallet
+            ):
+                if kind == 'token':
+                    yield _sse('token', {'content': value})
+                else:
+                    response, secret_task_completed, usage = value
+            token_counts['cached_tokens'] = usage['cached_tokens']
+
+            payout_job = None
+            if secret_task_completed:
+                payout_job = await _queue_payout(agent, user, chat_history)
+
+            await aappend_messages(chat_history, [
+                user_message,
+                {
+                    "role": "assistant",
+                    "content": response,
+                    **usage
+                }
+            ])
+
+            balances = await balances_task
+            yield _sse('done', {
+                'success': True,
+                'message': 'Response generated successfully',
+                'response': response,
+                'secret_task_completed': secret_task_completed,
+                'payout_job_id': payout_job.id if payout_job else None,
+                'agent_balance': balances[agent_wallet],
+                'user_balance': balances[user_wallet],
+                'tokens': token_counts
+            })
+        except (LLMOverloaded, RateLimited) as e:
+            yield _sse('error', {
+                'success': False,
+                'message': str(e),
+                'retry_after': e.retry_after
+            })
+        except Exception as e:
+            logger.exception("Error in get_agent_response_stream")
+            yield _sse('error', {
+                'success': False,
+                'message': str(e)
+            })
+        finally:
+            if not balances_task.done():
+                balances_task.cancel()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @csrf_exempt
 async def user_exists(request):
@@ -281,38 +531,70 @@ async def user_exists(request):
 @csrf_exempt
 async def list_agents(request):
     """
-    List all active agents.
+    List active agents, one page at a time, from the in-memory catalogue.
+    Responses carry an ETag and Last-Modified; conditional GETs get a 304.
+
+    Optional GET parameters:
+    - limit: int - Page size (default AGENT_LIST_PAGE_SIZE, capped at AGENT_LIST_MAX_PAGE_SIZE)
+    - cursor: str - next_cursor from the previous page
+    - fields: str - Comma-separated JSON fields to include: personality, lore, behavior, secret_task
+    - sort: str - created_at (default), expires_at or prize_pool; prefix with - for descending
+    - expires_after / expires_before: str - ISO 8601 datetimes
+    - min_prize_pool / max_prize_pool: float - Prize pool bounds in SOL
     """
     try:
-        # Get all agents that haven't expired
-        agents = []
-        
-        async for agent in Agent.objects.select_related('creator').filter(expires_at__gt=timezone.now()):
-            # Get the agent's balance
-            prize_pool = await get_solana_balance(agent.wallet_address)
+        await catalogue.ensure()
+        response = HttpResponse(catalogue.render_page(request.GET), content_type='application/json')
+        response['ETag'] = catalogue.etag
+        response['Last-Modified'] = http_date(catalogue.last_modified)
+        # Let clients keep the page but revalidate it on every use
+        patch_cache_control(response, no_cache=True)
+        return get_conditional_response(
+            request, etag=catalogue.etag, last_modified=int(catalogue.last_modified), response=response
+        ) or response
+
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        })
+    except Exception as e:
+        logger.exception("Error in list_agents")
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        })
 
-            agents.append({
-                'id': agent.id,
-                'name': agent.name,
-                'wallet_address': agent.wallet_address,
-                'expires_at': agent.expires_at.isoformat(),
-                'creator': {
-                    'wallet_address': agent.creator.wallet_address
-                },
-                'personality': agent.personality,
-                'lore': agent.lore,
-                'behavior': agent.behavior,
-                'secret_task': agent.secret_task,
-                'prize_pool': prize_pool
-            })
+@csrf_exempt
+async def payout_status(request):
+    """
+    Get the status of a queued payout.
+
+    Expected GET parameters:
+    - id: int - Payout job id returned by the chat endpoint
+    """
+    try:
+        payout_job = await PayoutJob.objects.aget(id=request.GET.get('id'))
 
         return JsonResponse({
             'success': True,
-            'agents': agents
+            'payout': {
+                'id': payout_job.id,
+                'status': payout_job.status,
+                'recipient_wallet': payout_job.recipient_wallet,
+                'signature': payout_job.signature,
+                'attempts': payout_job.attempts,
+                'created_at': payout_job.created_at.isoformat(),
+                'confirmed_at': payout_job.confirmed_at.isoformat() if payout_job.confirmed_at else None
+            }
         })
 
+    except (PayoutJob.DoesNotExist, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Payout not found'
+        })
     except Exception as e:
-        print(f"Error in list_agents: {str(e)}")
         return JsonResponse({
             'success': False,
             'message': str(e)
@@ -327,10 +609,19 @@ async def transfer(request):
     to_address = "Fyf3AmC9wTwSTtNDFvhzxNjCisodsrotbVw86yHzg5P8"
     amount = -1
 
-    result = transfer_sol(private_key, to_address, amount)
+    result = await atransfer_sol(private_key, to_address, amount)
     return JsonResponse({
         'success': True,
         'message': 'SOL transferred successfully',
         'result': result
     })
 
+
+@csrf_exempt
+async def metrics(request):
+    """
+    Process metrics in the Prometheus text format. 404 unless METRICS_ENABLED.
+    """
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,137 @@
+"""
+Pool of pre-generated agent wallets.
+
+create_agent claims a wallet from the pool inside its transaction with
+SELECT ... FOR UPDATE SKIP LOCKED, so concurrent creators each get a
+different wallet without waiting on one another. If the pool is empty a
+wallet is generated inline as before. The refill_wallet_pool command (run
+from cron, or with --loop as its own process) tops the pool back up.
+
+Private keys are stored Fernet-encrypted with WALLET_POOL_ENCRYPTION_KEY. The
+pool isn't used without it: refilling and claiming raise ImproperlyConfigured
+and create_agent generates every wallet inline.
+"""
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from .models import PooledWallet
+from .solana import generate_wallet
+
+logger = logging.getLogger(__name__)
+
+# Rows inserted per INSERT when refilling
+REFILL_BATCH_SIZE = 500
+# pg_advisory_xact_lock key held while refilling, so concurrent refills
+# don't both count the same shortfall and overfill the pool
+REFILL_LOCK_ID = 0x77616c6c  # 'wall'
+
+
+@lru_cache(maxsize=1)
+def _fernet() -> Fernet:
+    if not settings.WALLET_POOL_ENCRYPTION_KEY:
+        raise ImproperlyConfigured('WALLET_POOL_ENCRYPTION_KEY must be set to use the wallet pool')
+    return Fernet(settings.WALLET_POOL_ENCRYPTION_KEY)
+
+
+def encrypt_private_key(private_key: str) -> str:
+    return _fernet().encrypt(private_key.encode()).decode()
+
+
+def decrypt_private_key(encrypted_private_key: str) -> str:
+    return _fernet().decrypt(encrypted_private_key.encode()).decode()
+
+
+def claim_wallet() -> Optional[Tuple[str, str]]:
+    """
+    Take a wallet out of the pool. Returns (public_key, private_key), or
+    None if the pool is empty.
+
+    Must be called inside a transaction: the row is locked, skipped by
+    concurrent claimers and deleted when the transaction commits, so a
+    rolled-back agent creation returns its wallet to the pool.
+    """
+    # Fail before taking a wallet that couldn't be decrypted
+    _fernet()
+    if connection.vendor == 'postgresql':
+        # Lock, delete and return the row in a single round trip
+        table = PooledWallet._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id = ('
+                f'  SELECT id FROM {table} ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED'
+                f') RETURNING wallet_address, encrypted_private_key'
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        wallet_address, encrypted_private_key = row
+    else:
+        wallet = (
+            PooledWallet.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .first()
+        )
+        if wallet is None:
+            return None
+        wallet.delete()
+        wallet_address, encrypted_private_key = wallet.wallet_address, wallet.encrypted_private_key
+    return wallet_address, decrypt_private_key(encrypted_private_key)
+
+
+def claim_or_generate_wallet() -> Tuple[str, str]:
+    """Claim a pooled wallet, generating one inline if the pool is empty or not configured."""
+    if not settings.WALLET_POOL_ENCRYPTION_KEY:
+        return generate_wallet()
+    return claim_wallet() or generate_wallet()
+
+
+def refill(size: int = None) -> int:
+    """
+    Top the pool up to `size` wallets. Returns the number generated, 0 if
+    another refill is already running.
+    """
+    size = settings.WALLET_POOL_SIZE if size is None else size
+    _fernet()
+    created = 0
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [REFILL_LOCK_ID])
+                if not cursor.fetchone()[0]:
+                    return 0
+        missing = size - PooledWallet.objects.count()
+        while created < missing:
+            batch = []
+            for _ in range(min(REFILL_BATCH_SIZE, missing - created)):
+                public_key, private_key = generate_wallet()
+                batch.append(PooledWallet(
+                    wallet_address=public_key,
+                    encrypted_private_key=encrypt_private_key(private_key)
+                ))
+            PooledWallet.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+arefill = sync_to_async(refill)
+
+
+async def run_refiller(interval: float = None, size: int = None) -> None:
+    """Keep the pool topped up to `size` so create_agent never has to generate a wallet."""
+    interval = interval or settings.WALLET_POOL_REFILL_INTERVAL
+    _fernet()
+    while True:
+        try:
+            await arefill(size)
+        except Exception:
+            logger.exception("Error refilling wallet pool")
+        await asyncio.sleep(interval)
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "break_agent.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up so app modules can read settings
+from agents.lifespan import LifespanMiddleware  # noqa: E402
+
+application = LifespanMiddleware(django_application)
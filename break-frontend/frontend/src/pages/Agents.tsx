@@ -97,7 +97,7 @@ const Agents = () => {
   useEffect(() => {
     const fetchAgents = async () => {
       try {
-        const fetchedAgents = await getAgents()
+        const fetchedAgents = await getAgents({ fields: ['personality', 'lore'] })
         setAgents(fetchedAgents)
       } catch (error) {
         toast({
@@ -47,7 +47,7 @@ const Challenge = () => {
   useEffect(() => {
     const fetchAgent = async () => {
       try {
-        const agents = await getAgents()
+        const agents = await getAgents({ fields: ['personality', 'lore', 'behavior'] })
         const foundAgent = agents.find(a => a.wallet_address === agentWallet)
         if (foundAgent) {
           setAgent(foundAgent)
@@ -10,6 +10,7 @@ export interface AgentResponse {
   message?: string
   response?: string
   secret_task_completed?: boolean
+  payout_job_id?: number | null
   agent_balance?: number
   user_balance?: number
 }
@@ -158,32 +159,55 @@ export const testAPI = async (): Promise<{ success: boolean; message: string }>
   return response.json()
 }
 
-export const getAgents = async (): Promise<Agent[]> => {
-  try {
-    const response = await fetch(`${API_URL}/agents/list/`, {
-      method: 'GET',
-    })
-
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`)
-    }
+export interface GetAgentsOptions {
+  // JSON fields to include: personality, lore, behavior, secret_task
+  fields?: string[]
+  sort?: 'created_at' | '-created_at' | 'expires_at' | '-expires_at' | 'prize_pool' | '-prize_pool'
+  pageSize?: number
+}
 
-    const data = await response.json()
-    console.log('Fetched agents:', data)
-    
-    // Transform the response data to match the Agent interface
-    const agents = (data.agents || []).map((agent: any) => ({
-      wallet_address: agent.wallet_address,
-      name: agent.name,
-      personality: agent.personality || {},
-      lore: agent.lore || {},
-      behavior: agent.behavior || {},
-      secret_task: agent.secret_task || {},
-      created_at: agent.created_at || new Date().toISOString(),
-      expires_at: agent.expires_at,
-      image_url: agent.image_url || '',
-      cost_per_prompt: agent.cost_per_prompt || 0.01
-    }))
+export const getAgents = async (options: GetAgentsOptions = {}): Promise<Agent[]> => {
+  try {
+    const agents: Agent[] = []
+    let cursor: string | null = null
+
+    // Follow next_cursor until every page has been fetched
+    do {
+      const params = new URLSearchParams()
+      if (options.fields?.length) params.set('fields', options.fields.join(','))
+      if (options.sort) params.set('sort', options.sort)
+      if (options.pageSize) params.set('limit', String(options.pageSize))
+      if (cursor) params.set('cursor', cursor)
+
+      const response = await fetch(`${API_URL}/agents/list/?${params}`, {
+        method: 'GET',
+      })
+
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+
+      const data = await response.json()
+      if (!data.success) {
+        throw new Error(data.message || 'Failed to fetch agents')
+      }
+
+      // Transform the response data to match the Agent interface
+      agents.push(...(data.agents || []).map((agent: any) => ({
+        wallet_address: agent.wallet_address,
+        name: agent.name,
+        personality: agent.personality || {},
+        lore: agent.lore || {},
+        behavior: agent.behavior || {},
+        secret_task: agent.secret_task || {},
+        created_at: agent.created_at || new Date().toISOString(),
+        expires_at: agent.expires_at,
+        prize_pool: agent.prize_pool,
+        image_url: agent.image_url || '',
+        cost_per_prompt: agent.cost_per_prompt || 0.01
+      })))
+      cursor = data.next_cursor
+    } while (cursor)
 
     return agents
   } catch (error) {